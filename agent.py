@@ -1,11 +1,19 @@
+import asyncio
 import logging
-from typing import Dict, Any, List, Optional
+import re
+import time
+import weakref
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple
 import google.generativeai as genai
+from google.api_core.exceptions import ResourceExhausted
+from tenacity import AsyncRetrying, retry_if_exception_type, stop_after_attempt, wait_exponential
 import os
 from dotenv import load_dotenv
 
 # Import our custom tools
 from tools import seek_facts, seek_context
+import llm_cache
+import semantic_cache
 
 # --- 1. SET UP PROFESSIONAL LOGGING ---
 # REMOVED basicConfig, ADDED this:
@@ -19,10 +27,12 @@ if not GEMINI_API_KEY:
     logger.error("FATAL ERROR: GEMINI_API_KEY not found in .env file.")
     exit(1)
 
+GEMINI_MODEL_NAME = 'gemini-2.5-flash'
+
 try:
     genai.configure(api_key=GEMINI_API_KEY)
     GEMINI_MODEL = gen_model = genai.GenerativeModel(
-        'gemini-2.5-flash',
+        GEMINI_MODEL_NAME,
         # Set safety to a minimum to avoid blocks on harmless words
         safety_settings={'HARASSMENT':'BLOCK_NONE', 'HATE':'BLOCK_NONE'}
     )
@@ -32,217 +42,496 @@ except Exception as e:
     exit(1)
 
 
+# --- 3. PROMPTS ---
+# Ordering rule: every prompt starts with one of these constants, byte for
+# byte, and all per-request text (context, question, message) goes at the
+# tail. Gemini's prefix caching only reuses work for an identical leading
+# block, so never interpolate anything into these preambles.
+SYSTEM_PREAMBLE = """You are a helpful assistant. Based *only* on the context I provide,
+answer the user's question."""
+
+EXTRACTOR_PREAMBLE = """You are an entity extractor. From the text you are given, extract the *specific* entity requested.
+Be very concise. For example, if the text is "I like lilies and roses", the preference is "lilies and roses".
+If the text is "Plan a trip to the distilleries", the trip_subject is "distilleries"."""
+
+# Full templates, built once at import. Only the tail is interpolated, so
+# the preamble bytes stay identical across calls.
+EXTRACT_TPL = EXTRACTOR_PREAMBLE + '\n\nEntity type: {entity_type}\n\nText:\n"{message}"\n\nExtracted {entity_type}:'
+SYNTH_TPL = SYSTEM_PREAMBLE + "\n\nContext:\n{context}\n\nQuestion:\n{question}\n\nAnswer:"
+CONTEXT_LINE_TPL = "- (From {timestamp}) {user_name}: {message}"
+
+
+# --- 4. RECOMMENDER KEYWORDS ---
+# Whole-word matches, with an optional plural "s" ("favorites", "flights",
+# "trips"). All tiers are folded into one compiled alternation, so each
+# message is scanned once no matter how many keywords there are.
+PREF_HIGH = frozenset({"favorite", "lilies", "roses"})
+PREF_LOW = frozenset({"outstanding", "concierge"})
+TRAVEL = frozenset({"trip", "flight", "planning", "distilleries", "journey"})
+
+KEYWORD_TIERS = {
+    **{kw: "pref_high" for kw in PREF_HIGH},
+    **{kw: "pref_low" for kw in PREF_LOW},
+    **{kw: "travel" for kw in TRAVEL},
+}
+KEYWORD_PATTERN = re.compile(
+    r"\b("
+    + "|".join(re.escape(kw) for kw in sorted(KEYWORD_TIERS, key=len, reverse=True))
+    + r")s?\b"
+)
+
+# Known entity spans per entity type. When one matches, the span *is* the
+# answer the extractor would give, so the LLM call is skipped entirely.
+ENTITY_SPAN_PATTERNS = {
+    "preference": re.compile(r"\b(lilies(?: and roses)?|roses)\b", re.IGNORECASE),
+    "trip_subject": re.compile(r"\b(distilleries|whisk(?:e)?y)\b", re.IGNORECASE),
+}
+
+
+# --- 5. GEMINI RATE LIMITING ---
+# Concurrent extractor/synthesizer/test calls would otherwise burst past
+# the per-minute quota and come back as 429s.
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+GEMINI_RPM = int(os.getenv("GEMINI_RPM", "60"))
+GEMINI_MAX_ATTEMPTS = 4
+
+
+class _TokenBucket:
+    """
+    Async token bucket: refills at `rate` tokens per second and holds at
+    most `capacity`, so short bursts are allowed but the average rate is not.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+# An asyncio.Semaphore binds to the first loop that waits on it, so keep
+# one per running loop (asyncio.run in scripts and tests makes new ones).
+_GEMINI_SEMS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+GEMINI_BUCKET = _TokenBucket(rate=GEMINI_RPM / 60.0, capacity=GEMINI_MAX_CONCURRENCY)
+
+
+def _gemini_sem() -> asyncio.Semaphore:
+    """
+    Returns the running loop's GEMINI_MAX_CONCURRENCY semaphore.
+    """
+    loop = asyncio.get_running_loop()
+    sem = _GEMINI_SEMS.get(loop)
+    if sem is None:
+        sem = _GEMINI_SEMS[loop] = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+    return sem
+
+
+async def _gemini(prompt: str, **kwargs):
+    """
+    The single entry point for Gemini generate calls: bounded concurrency,
+    an RPM budget, and exponential backoff when the quota is exhausted.
+    """
+    async for attempt in AsyncRetrying(
+        retry=retry_if_exception_type(ResourceExhausted),
+        wait=wait_exponential(multiplier=1, max=30),
+        stop=stop_after_attempt(GEMINI_MAX_ATTEMPTS),
+        reraise=True,
+    ):
+        with attempt:
+            async with _gemini_sem():
+                await GEMINI_BUCKET.acquire()
+                return await GEMINI_MODEL.generate_content_async(prompt, **kwargs)
+
+
+async def _gemini_stream(prompt: str, **kwargs) -> AsyncIterator[Any]:
+    """
+    Streaming counterpart of _gemini. The concurrency slot is held until the
+    stream is drained or closed, not just until the first response arrives.
+    A 429 is retried only while nothing has been yielded, so callers never
+    see a chunk twice.
+    """
+    for attempt in range(1, GEMINI_MAX_ATTEMPTS + 1):
+        started = False
+        try:
+            async with _gemini_sem():
+                await GEMINI_BUCKET.acquire()
+                response = await GEMINI_MODEL.generate_content_async(prompt, stream=True, **kwargs)
+                async for chunk in response:
+                    started = True
+                    yield chunk
+            return
+        except ResourceExhausted:
+            if started or attempt == GEMINI_MAX_ATTEMPTS:
+                raise
+            # Same schedule as _gemini's wait_exponential(multiplier=1, max=30).
+            await asyncio.sleep(min(2 ** (attempt - 1), 30))
+
+
+# --- 6. CACHED GEMINI CALL ---
+async def _generate(prompt: str, **kwargs) -> Optional[str]:
+    """
+    Calls Gemini through the on-disk prompt cache.
+    Returns the response text, or None if Gemini returned no content
+    (e.g. safety filter). Blocked responses are never cached.
+    """
+    cached = await asyncio.to_thread(llm_cache.get, prompt, GEMINI_MODEL_NAME)
+    if cached is not None:
+        return cached
+
+    response = await _gemini(prompt, **kwargs)
+    if not response.parts:
+        return None
+
+    await asyncio.to_thread(llm_cache.set, prompt, response.text, GEMINI_MODEL_NAME)
+    return response.text
+
+
 # --- UPDATED: TOOL 3 (Helper Function) ---
-def _extract_entity(message: str, entity_type: str) -> str:
+async def _extract_entity(message: str, entity_type: str) -> str:
     """
     A dedicated LLM call to extract a specific entity from a message.
     """
-    logger.info(f"[Tool 3 Extractor] Extracting '{entity_type}' from: {message}")
+    logger.debug("[Tool 3 Extractor] Extracting '%s' from: %s", entity_type, message)
     try:
-        prompt = f"""
-        You are an entity extractor. From the following text, extract the *specific* {entity_type}.
-        Be very concise. For example, if the text is "I like lilies and roses", the preference is "lilies and roses".
-        If the text is "Plan a trip to the distilleries", the trip_subject is "distilleries".
-        
-        Text:
-        "{message}"
-        
-        Extracted {entity_type}:
-        """
-        response = GEMINI_MODEL.generate_content(prompt)
+        prompt = EXTRACT_TPL.format(entity_type=entity_type, message=message)
+        text = await _generate(prompt)
         
         # --- THIS IS THE FINAL FIX ---
         # Add a safety check in case Gemini blocks the response
-        if not response.parts:
+        if text is None:
             logger.warning("[Tool 3 Extractor] No content part returned (likely safety filter).")
             return message # Fallback to the full message
         # --- END FIX ---
 
-        entity = response.text.strip().replace('"', '').replace('\n', '')
-        logger.info(f"[Tool 3 Extractor] Extracted: {entity}")
+        entity = text.strip().replace('"', '').replace('\n', '')
+        logger.debug("[Tool 3 Extractor] Extracted: %s", entity)
         return entity
     except Exception as e:
         logger.error(f"[Tool 3 Extractor] Failed: {e}", exc_info=True)
         return message # Fallback to the full message
 
+def _build_recommendation(kind: str, value: str, source_message: str) -> Dict[str, Any]:
+    """
+    Formats an extracted entity into the structured recommendation payload.
+    """
+    if kind == "preference_high":
+        return {
+            "action_id": "save_preference",
+            "suggestion_text": f"I've noted a strong preference for '{value}'. Would you like to save this to the member's profile?",
+            "structured_data": {"type": "preference", "value": value, "source_message": source_message}
+        }
+    if kind == "preference_low":
+        return {
+            "action_id": "save_preference",
+            "suggestion_text": f"I noted a preference for '{value}'. Would you like to save this to the member's profile?",
+            "structured_data": {"type": "preference", "value": value, "source_message": source_message}
+        }
+    return {
+        "action_id": "suggest_trip_itinerary",
+        "suggestion_text": f"I see a message about a trip to '{value}'. Would you like to start an itinerary?",
+        "structured_data": {"type": "travel", "value": value, "source_message": source_message}
+    }
+
 # --- UPDATED: TOOL 3: Action Recommender (Smarter Prioritization) ---
-def get_recommendation(question: str, context: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+async def get_recommendation(question: str, context: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
     """
     A smarter, evidence-based engine. It now prioritizes
     high-value keywords (like 'favorite') over generic ones.
+
+    Every item is scored first; the LLM extractor then runs once,
+    for the winning item only.
     """
-    logger.info("[Tool 3: Recommender] Analyzing context for recommendations...")
+    logger.debug("[Tool 3: Recommender] Analyzing context for recommendations...")
     
     question_lower = question.lower()
     if not isinstance(context, list):
         return None # Can't do anything
 
-    best_recommendation = None
+    # Fact_Seeker evidence carries no message to mine; skip it up front so
+    # fact-based queries never enter the scan at all.
+    scanned = [item for item in context if item.get("source") != "Fact_Seeker"]
+    if not scanned:
+        logger.debug("[Tool 3: Recommender] No message context to analyze.")
+        return None
+
     best_score = 0 # 0 = no match, 1 = low-priority, 2 = high-priority
+    best_match = None # (item, kind, entity_type) of the current leader
     
     # INTENT 1: Is this a "preference" question?
     is_preference_query = "like" in question_lower or "favorite" in question_lower
     if is_preference_query:
-        logger.info("[Tool 3] Question intent is 'preference'.")
+        logger.debug("[Tool 3] Question intent is 'preference'.")
     
-    for item in context:
-        if item.get("source") == "Fact_Seeker": continue
-        message = item.get("message", "").lower()
+    for item in scanned:
+        tags = {
+            KEYWORD_TIERS[m.group(1)]
+            for m in KEYWORD_PATTERN.finditer(item.get("message", "").lower())
+        }
         
         # --- Check for Preferences ---
         # High-priority: explicit keywords
-        if "favorite" in message or "lilies" in message or "roses" in message:
+        if "pref_high" in tags:
             if best_score < 2: # Only overwrite if this is a better match
-                logger.info(f"[Tool 3] Found HIGH-PRIORITY preference (rowid {item.get('rowid')})")
+                logger.debug("[Tool 3] Found HIGH-PRIORITY preference (rowid %s)", item.get('rowid'))
                 best_score = 2
-                extracted_pref = _extract_entity(item['message'], "preference")
-                best_recommendation = {
-                    "action_id": "save_preference",
-                    "suggestion_text": f"I've noted a strong preference for '{extracted_pref}'. Would you like to save this to the member's profile?",
-                    "structured_data": {"type": "preference", "value": extracted_pref, "source_message": item['message']}
-                }
+                best_match = (item, "preference_high", "preference")
         
         # Low-priority: generic keywords (only if it's a preference query)
-        elif is_preference_query and ("outstanding" in message or "concierge" in message):
+        elif is_preference_query and "pref_low" in tags:
             if best_score < 1: # Don't overwrite a high-priority match
-                logger.info(f"[Tool 3] Found LOW-PRIORITY preference (rowid {item.get('rowid')})")
+                logger.debug("[Tool 3] Found LOW-PRIORITY preference (rowid %s)", item.get('rowid'))
                 best_score = 1
-                extracted_pref = _extract_entity(item['message'], "preference")
-                best_recommendation = {
-                    "action_id": "save_preference",
-                    "suggestion_text": f"I noted a preference for '{extracted_pref}'. Would you like to save this to the member's profile?",
-                    "structured_data": {"type": "preference", "value": extracted_pref, "source_message": item['message']}
-                }
+                best_match = (item, "preference_low", "preference")
 
         # --- Check for Travel (only if we haven't found a preference) ---
-        travel_keywords = ["trip", "flight", "planning", "distilleries", "journey"]
-        if not is_preference_query and best_score == 0 and any(kw in message for kw in travel_keywords):
-            logger.info(f"[Tool 3] Found travel intent in message (rowid {item.get('rowid')})")
+        if not is_preference_query and best_score == 0 and "travel" in tags:
+            logger.debug("[Tool 3] Found travel intent in message (rowid %s)", item.get('rowid'))
             best_score = 1
-            extracted_trip = _extract_entity(item['message'], "trip_subject")
-            best_recommendation = {
-                "action_id": "suggest_trip_itinerary",
-                "suggestion_text": f"I see a message about a trip to '{extracted_trip}'. Would you like to start an itinerary?",
-                "structured_data": {"type": "travel", "value": extracted_trip, "source_message": item['message']}
-            }
+            best_match = (item, "travel", "trip_subject")
+
+    # Only the winner's entity is ever shown, so extract just that one:
+    # from a known span if possible, otherwise with the LLM.
+    best_recommendation = None
+    if best_match:
+        item, kind, entity_type = best_match
+        span = ENTITY_SPAN_PATTERNS[entity_type].search(item['message'])
+        if span:
+            extracted = span.group(1)
+            logger.debug("[Tool 3 Extractor] Matched known span: %s", extracted)
+        else:
+            extracted = await _extract_entity(item['message'], entity_type)
+        best_recommendation = _build_recommendation(kind, extracted, item['message'])
             
     if not best_recommendation:
-        logger.info("[Tool 3: Recommender] No specific recommendation found.")
+        logger.debug("[Tool 3: Recommender] No specific recommendation found.")
         
     return best_recommendation
 
 
 # --- TOOL 4: Synthesizer (The LLM) ---
-def synthesize_answer(question: str, context: List[Dict[str, Any]]) -> str:
-    """
-    Uses the Gemini LLM to generate a final, human-friendly answer.
-    """
-    logger.info("[Tool 4: Synthesizer] Generating final answer with LLM...")
-    
+def _synthesis_prompt(question: str, context: List[Dict[str, Any]]) -> str:
+    """Builds the synthesizer prompt from the structured context."""
     # Create a clean prompt with our new structured context
     context_str = "\n".join(
-        [f"- (From {d.get('timestamp', 'N/A')}) {d.get('user_name', 'N/A')}: {d.get('message', 'N/A')}" for d in context if d.get('message')]
+        [
+            CONTEXT_LINE_TPL.format(
+                timestamp=d.get('timestamp', 'N/A'),
+                user_name=d.get('user_name', 'N/A'),
+                message=d['message'],
+            )
+            for d in context if d.get('message')
+        ]
     )
     
-    prompt = f"""
-    You are a helpful assistant. Based *only* on the context I provide,
-    answer the user's question.
-    
-    Context:
-    {context_str}
-    
-    Question:
-    {question}
-    
-    Answer:
+    # Static preamble first, volatile context and question last (see PROMPTS).
+    return SYNTH_TPL.format(context=context_str, question=question)
+
+
+async def synthesize_answer_stream(question: str, context: List[Dict[str, Any]]) -> AsyncIterator[str]:
+    """
+    Uses the Gemini LLM to generate a final, human-friendly answer,
+    yielding text chunks as soon as Gemini produces them.
+    Cache hits are yielded as a single chunk.
     """
+    logger.debug("[Tool 4: Synthesizer] Generating final answer with LLM...")
+    prompt = _synthesis_prompt(question, context)
+    chunks = []
     
     try:
-        response = GEMINI_MODEL.generate_content(prompt)
+        # Exact prompt hit first; then a paraphrase over the same context.
+        text = await asyncio.to_thread(llm_cache.get, prompt, GEMINI_MODEL_NAME)
+        if text is not None:
+            yield text
+            return
+
+        digest = semantic_cache.context_digest(context)
+        question_vector = await semantic_cache.embed(question)
+        if question_vector is not None:
+            cached_answer = await asyncio.to_thread(semantic_cache.lookup, question_vector, digest)
+            if cached_answer is not None:
+                yield cached_answer
+                return
+
+        async for chunk in _gemini_stream(prompt):
+            if not chunk.parts:
+                continue
+            chunks.append(chunk.text)
+            yield chunk.text
         
         # Add safety check here too
-        if not response.parts:
+        if not chunks:
             logger.warning("[Tool 4 Synthesizer] No content part returned (likely safety filter).")
-            return "I found the context, but I am unable to formulate a response at this time."
-            
-        return response.text
+            yield "I found the context, but I am unable to formulate a response at this time."
+            return
+
+        text = "".join(chunks)
+        await asyncio.to_thread(llm_cache.set, prompt, text, GEMINI_MODEL_NAME)
+        if question_vector is not None:
+            await asyncio.to_thread(semantic_cache.add, question_vector, digest, text)
     except Exception as e:
         logger.error(f"[Synthesizer] Error generating content: {e}", exc_info=True)
-        return "I'm sorry, I encountered an error while formulating a response."
+        if not chunks:
+            yield "I'm sorry, I encountered an error while formulating a response."
+
+
+async def synthesize_answer(question: str, context: List[Dict[str, Any]]) -> str:
+    """
+    Uses the Gemini LLM to generate a final, human-friendly answer.
+    """
+    return "".join([chunk async for chunk in synthesize_answer_stream(question, context)])
 
 
 # --- THE "MANAGER": The Router Agent ---
-def run_agent(question: str) -> Dict[str, Any]:
+async def _route(question: str, trace: List[str]) -> Tuple[Optional[Dict[str, Any]], Optional[List[Dict[str, Any]]]]:
     """
-    Runs the full agentic pipeline:
-    1. Route to the correct tool (Fact or Context).
-    2. Get a recommendation.
-    3. Synthesize the final answer.
-    4. Return the full, structured response.
+    Router: tries Tool 1 (Fact_Seeker), then Tool 2 (Context_Seeker).
+    Returns (fact_result, context); context is None if nothing was found.
+    Both tools are blocking (DuckDB, encoder, FAISS), so they run in a
+    worker thread to keep the event loop free for other requests.
     """
-    logger.info(f"\n--- New Query Received --- \nQuestion: {question}")
-    trace = []
-    
-    # --- 1. ROUTER LOGIC ---
     trace.append("Router: Received query.")
-    fact_result = seek_facts(question)
+    fact_result = await asyncio.to_thread(seek_facts, question)
     
     if fact_result:
         trace.append("Router: Query is fact-based. Using Tool 1 (Fact_Seeker).")
         # Standardize context to be a list of dicts
         context = [{"source": "Fact_Seeker", "context": fact_result["context"]}]
-        final_answer = fact_result["answer"]
         trace.append("Synthesizer: Bypassed. Used direct answer from tool.")
-    else:
-        trace.append("Router: Query is vague/contextual. Using Tool 2 (Context_Seeker).")
-        context = seek_context(question) # This now returns a list of dicts
-        
-        if not context:
-            trace.append("Context_Seeker: No context found.")
-            return {
-                "answer": "I'm sorry, I couldn't find any information about that.",
-                "evidence": [],
-                "proactive_recommendation": None,
-                "reasoning_trace": trace
-            }
-        
-        # --- 3. SYNTHESIZER ---
-        trace.append("Router: Calling Tool 4 (Synthesizer).")
-        final_answer = synthesize_answer(question, context)
+        return fact_result, context
 
-    # --- 4. RECOMMENDER ---
-    trace.append("Router: Calling Tool 3 (Recommender).")
-    recommendation = get_recommendation(question, context)
+    trace.append("Router: Query is vague/contextual. Using Tool 2 (Context_Seeker).")
+    context = await asyncio.to_thread(seek_context, question) # This now returns a list of dicts
+    if not context:
+        trace.append("Context_Seeker: No context found.")
+        return None, None
+    return None, context
 
-    # --- 5. FINAL RESPONSE ---
-    trace.append("Router: Formatting final response.")
+
+def _response(answer: str, context: List[Dict[str, Any]], recommendation: Optional[Dict[str, Any]], trace: List[str], fact_result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Formats the final, structured agent response."""
     return {
-        "answer": final_answer,
+        "answer": answer,
         "evidence": context, # This is now the clean, structured list
         "proactive_recommendation": recommendation, # This is now a structured object
-        "reasoning_trace": trace
+        "reasoning_trace": trace,
+        # The router tries Fact_Seeker first and falls back to Context_Seeker.
+        "tool_used": "Fact_Seeker" if fact_result else "Context_Seeker"
     }
 
 
+NO_CONTEXT_ANSWER = "I'm sorry, I couldn't find any information about that."
+
+
+async def run_agent(question: str) -> Dict[str, Any]:
+    """
+    Runs the full agentic pipeline:
+    1. Route to the correct tool (Fact or Context).
+    2. Synthesize the final answer and get a recommendation (concurrently).
+    3. Return the full, structured response.
+    """
+    logger.debug("\n--- New Query Received --- \nQuestion: %s", question)
+    trace = []
+    
+    # --- 1. ROUTER LOGIC ---
+    fact_result, context = await _route(question, trace)
+    if context is None:
+        return _response(NO_CONTEXT_ANSWER, [], None, trace, fact_result)
+        
+    # --- 2. SYNTHESIZER + RECOMMENDER ---
+    # The recommender only depends on the context, so both LLM-backed
+    # tools run side by side and we wait for the slower of the two.
+    if fact_result:
+        trace.append("Router: Calling Tool 3 (Recommender).")
+        final_answer = fact_result["answer"]
+        recommendation = await get_recommendation(question, context)
+    else:
+        trace.append("Router: Calling Tool 4 (Synthesizer) and Tool 3 (Recommender) concurrently.")
+        final_answer, recommendation = await asyncio.gather(
+            synthesize_answer(question, context),
+            get_recommendation(question, context),
+        )
+
+    # --- 3. FINAL RESPONSE ---
+    trace.append("Router: Formatting final response.")
+    return _response(final_answer, context, recommendation, trace, fact_result)
+
+
+async def run_agent_stream(question: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming variant of run_agent. Yields events:
+    - {"type": "token", "delta": str} as the answer is generated;
+    - one final {"type": "final", "response": {...}} carrying the same
+      payload run_agent returns.
+    The recommender runs in the background while tokens stream.
+    """
+    logger.debug("\n--- New Streaming Query Received --- \nQuestion: %s", question)
+    trace = []
+
+    fact_result, context = await _route(question, trace)
+    if context is None:
+        yield {"type": "token", "delta": NO_CONTEXT_ANSWER}
+        yield {"type": "final", "response": _response(NO_CONTEXT_ANSWER, [], None, trace, fact_result)}
+        return
+
+    if fact_result:
+        trace.append("Router: Calling Tool 3 (Recommender).")
+        final_answer = fact_result["answer"]
+        recommendation_task = asyncio.create_task(get_recommendation(question, context))
+        yield {"type": "token", "delta": final_answer}
+    else:
+        trace.append("Router: Streaming Tool 4 (Synthesizer) while Tool 3 (Recommender) runs.")
+        recommendation_task = asyncio.create_task(get_recommendation(question, context))
+        chunks = []
+        try:
+            async for delta in synthesize_answer_stream(question, context):
+                chunks.append(delta)
+                yield {"type": "token", "delta": delta}
+        except BaseException:
+            # Client went away mid-stream; don't leak the recommender.
+            recommendation_task.cancel()
+            raise
+        final_answer = "".join(chunks)
+
+    recommendation = await recommendation_task
+    trace.append("Router: Formatting final response.")
+    yield {"type": "final", "response": _response(final_answer, context, recommendation, trace, fact_result)}
+
+
 # --- Main Test Block ---
+TEST_QUERIES = [
+    ("(Test 1) Fact-Based Query", "Who is the most active user?"),
+    ("(Test 2) Context-Based Query", "What does Lily O'Sullivan like?"),
+    ("(Test 3) Fact-Based Query (with Travel)", "What is Lily O'Sullivan planning about distilleries?"),
+]
+
+
+async def run_tests_async():
+    """Runs all test queries through the agent concurrently."""
+    import json
+
+    # Plural keywords must still tag a message (no Gemini or index needed).
+    tags = {KEYWORD_TIERS[m.group(1)] for m in KEYWORD_PATTERN.finditer("her favorites? we booked two flights")}
+    assert tags == {"pref_high", "travel"}, tags
+
+    results = await asyncio.gather(*(run_agent(q) for _, q in TEST_QUERIES))
+    for (label, _), result in zip(TEST_QUERIES, results):
+        print(f"\n--- {label} ---")
+        print(json.dumps(result, indent=2))
+
+
 def run_tests():
     """Runs tests on the full agent pipeline."""
-    import json
-    
-    print("\n--- (Test 1) Fact-Based Query ---")
-    q1 = "Who is the most active user?"
-    a1 = run_agent(q1)
-    print(json.dumps(a1, indent=2))
-    
-    print("\n--- (Test 2) Context-Based Query ---")
-    q2 = "What does Lily O'Sullivan like?"
-    a2 = run_agent(q2)
-    print(json.dumps(a2, indent=2))
-    
-    print("\n--- (Test 3) Fact-Based Query (with Travel) ---")
-    q3 = "What is Lily O'Sullivan planning about distilleries?"
-    a3 = run_agent(q3)
-    print(json.dumps(a3, indent=2))
+    asyncio.run(run_tests_async())
 
 if __name__ == "__main__":
     run_tests()
\ No newline at end of file
@@ -0,0 +1,18 @@
+import os
+
+# --- Shared configuration ---
+# Single source of truth for the file paths, model and API endpoint used by
+# data_loader.py, index.py, tools.py, main.py, demo.py and evaluate.py.
+
+# Data & index files (written by data_loader.py / index.py)
+DB_FILE = "data.db"
+INDEX_FILE = "index.faiss"
+# Index type and search parameters, written next to the index
+INDEX_META_FILE = "index.meta.json"
+
+# Embedding model; the indexer and the query side must agree on it
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Agent API endpoint used by the clients (demo.py, evaluate.py).
+# Fallback to localhost if not set
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8000/ask")
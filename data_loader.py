@@ -1,8 +1,10 @@
-import requests
+import asyncio
+import aiohttp
+import orjson
 import duckdb
 import os
 import logging
-import pandas as pd
+import pyarrow as pa
 from typing import List, Dict, Any, Optional
 
 # --- 1. SET UP PROFESSIONAL LOGGING ---
@@ -13,70 +15,151 @@ logging.basicConfig(
 
 # --- Configuration ---
 API_URL = "https://november7-730026606190.europe-west1.run.app/messages/"
-DB_FILE = "data.db"
+from config import DB_FILE, INDEX_META_FILE
 BATCH_SIZE = 500  # How many messages to fetch per API call
+# Columns of the messages table, all VARCHAR, in the API's item order.
+# Timestamps stay strings to handle timezone info gracefully (they were once
+# parsed as 'datetime64[ns]'). Spelled out so a key missing from the first
+# item (or null in it) can't drop or mistype a column.
+MESSAGE_SCHEMA = pa.schema([
+    ("id", pa.string()),
+    ("user_id", pa.string()),
+    ("user_name", pa.string()),
+    ("timestamp", pa.string()),
+    ("message", pa.string()),
+])
+MAX_CONCURRENCY = 8  # How many page requests may be in flight at once
+REQUEST_TIMEOUT = 10  # Seconds, per request
+RETRY_TOTAL = 3  # Retries per page on transient failures
+RETRY_BACKOFF = 0.5  # Seconds; doubles on every retry
+RETRY_STATUSES = frozenset({500, 502, 503, 504})
 
-# --- 2. ROBUST, PAGINATED FETCHER ---
-def fetch_data() -> Optional[List[Dict[str, Any]]]:
+# --- 2. ROBUST, CONCURRENT PAGINATED FETCHER ---
+async def _fetch_page(
+    session: aiohttp.ClientSession,
+    semaphore: asyncio.Semaphore,
+    skip: int
+) -> Optional[Dict[str, Any]]:
+    """
+    Fetches one page. Returns the decoded body, or None when the API
+    signals that pagination is over (402 limit or 404).
+    Transient failures (5xx, dropped connections, timeouts) are retried
+    with exponential backoff.
+    """
+    for attempt in range(RETRY_TOTAL + 1):
+        retryable = attempt < RETRY_TOTAL
+        try:
+            async with semaphore:
+                logging.info(f"Fetching batch: skip={skip}, limit={BATCH_SIZE}")
+                async with session.get(
+                    API_URL,
+                    params={"skip": skip, "limit": BATCH_SIZE}
+                ) as response:
+                    if response.status == 402:
+                        logging.warning(f"API returned 402 Payment Required at skip={skip}. Stopping fetch.")
+                        logging.warning("This is a known limit. Using the data we have.")
+                        return None
+                    if response.status == 404:
+                        logging.info(f"API returned 404 Not Found at skip={skip}. This means we've fetched all data.")
+                        return None
+                    if response.status in RETRY_STATUSES and retryable:
+                        logging.warning(f"API returned {response.status} at skip={skip}. Retrying.")
+                    else:
+                        response.raise_for_status()  # Check for HTTP errors (4xx, 5xx)
+                        return orjson.loads(await response.read())
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+            if not retryable:
+                raise
+            logging.warning(f"Transient error at skip={skip}: {e!r}. Retrying.")
+
+        # Back off outside the semaphore so other pages can proceed.
+        await asyncio.sleep(RETRY_BACKOFF * (2 ** attempt))
+
+
+async def fetch_data_async() -> Optional[List[Dict[str, Any]]]:
     """
-    Fetches all messages from the API using robust pagination.
+    Fetches all messages from the API, overlapping page requests.
+
+    The first page is fetched alone. If it reports a total, every
+    remaining page is scheduled at once; otherwise pages are requested in
+    waves of MAX_CONCURRENCY until an empty page or a stop sentinel.
+    Pages are always consumed in order, so the result matches a
+    sequential fetch.
     """
     logging.info(f"Starting data fetch from {API_URL}")
-    
+
     all_messages = []
-    skip = 0
-    
-    while True:
-        try:
-            logging.info(f"Fetching batch: skip={skip}, limit={BATCH_SIZE}")
-            response = requests.get(
-                API_URL, 
-                params={"skip": skip, "limit": BATCH_SIZE},
-                timeout=10  # Set a timeout
-            )
-            response.raise_for_status()  # Check for HTTP errors (4xx, 5xx)
-            
-            data = response.json()
-            messages = data.get("items")
-            
-            if messages is None:
-                logging.error("API Error: 'items' key not found in response.")
-                return None
-            
-            if not messages:
-                # This is the normal exit condition
-                logging.info("No more messages found. Pagination complete.")
-                break
-            
-            all_messages.extend(messages)
-            skip += BATCH_SIZE 
-
-        # --- 3. SPECIFIC ERROR HANDLING ---
-        except requests.exceptions.ConnectionError as e:
-            logging.error(f"Network Error: Could not connect to API. {e}")
-            return None
-        except requests.exceptions.Timeout as e:
-            logging.error(f"Timeout Error: The request to the API timed out. {e}")
-            return None
-        except requests.exceptions.JSONDecodeError as e:
-            logging.error(f"JSON Error: Could not decode response from API. {e}")
-            return None
-        except requests.exceptions.RequestException as e:
-            if e.response:
-                if e.response.status_code == 402:
-                    logging.warning("API returned 402 Payment Required. Stopping fetch.")
-                    logging.warning("This is a known limit. Using the data we have.")
-                    break 
-                if e.response.status_code == 404:
-                    logging.info("API returned 404 Not Found. This means we've fetched all data.")
-                    break
-            
-            logging.error(f"API Error: {e}") 
-            return None
+    semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    # One keep-alive pool, sized to the fan-out, shared by every page.
+    connector = aiohttp.TCPConnector(limit=MAX_CONCURRENCY, limit_per_host=MAX_CONCURRENCY)
 
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            first_page = await _fetch_page(session, semaphore, 0)
+            pages = [first_page]
+            skip = BATCH_SIZE
+
+            total = first_page.get("total") if first_page else None
+            if isinstance(total, int):
+                logging.info(f"API reports {total} messages in total.")
+
+            while True:
+                # Consume pages in order, stopping at the first sentinel.
+                for page in pages:
+                    if isinstance(page, Exception):
+                        raise page
+                    if page is None:
+                        return _finish(all_messages)
+
+                    messages = page.get("items")
+                    if messages is None:
+                        logging.error("API Error: 'items' key not found in response.")
+                        return None
+                    if not messages:
+                        # This is the normal exit condition
+                        logging.info("No more messages found. Pagination complete.")
+                        return _finish(all_messages)
+                    all_messages.extend(messages)
+
+                if isinstance(total, int):
+                    skips = list(range(skip, total, BATCH_SIZE))
+                    if not skips:
+                        logging.info("All reported pages fetched. Pagination complete.")
+                        return _finish(all_messages)
+                else:
+                    skips = [skip + i * BATCH_SIZE for i in range(MAX_CONCURRENCY)]
+
+                pages = await asyncio.gather(
+                    *(_fetch_page(session, semaphore, s) for s in skips),
+                    return_exceptions=True
+                )
+                skip = skips[-1] + BATCH_SIZE
+
+    # --- 3. SPECIFIC ERROR HANDLING ---
+    except aiohttp.ClientConnectionError as e:
+        logging.error(f"Network Error: Could not connect to API. {e}")
+        return None
+    except asyncio.TimeoutError as e:
+        logging.error(f"Timeout Error: The request to the API timed out. {e}")
+        return None
+    except orjson.JSONDecodeError as e:
+        logging.error(f"JSON Error: Could not decode response from API. {e}")
+        return None
+    except aiohttp.ClientError as e:
+        logging.error(f"API Error: {e}")
+        return None
+
+
+def _finish(all_messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     logging.info(f"Success! Fetched a total of {len(all_messages)} messages.")
     return all_messages
 
+
+def fetch_data() -> Optional[List[Dict[str, Any]]]:
+    """Blocking wrapper around fetch_data_async."""
+    return asyncio.run(fetch_data_async())
+
 # --- 4. EFFICIENT BATCH INSERT ---
 def create_database(messages: List[Dict[str, Any]]):
     """
@@ -86,29 +169,35 @@ def create_database(messages: List[Dict[str, Any]]):
         logging.warning("No messages to load. Exiting.")
         return
 
+    # Build the Arrow table straight from the API dicts; DuckDB scans it
+    # zero-copy, with no pandas object columns in between. Missing keys
+    # become NULLs and numeric ids are cast to strings. Done before the old
+    # database is removed, so a malformed payload leaves it in place.
+    try:
+        tbl = pa.table(
+            [pa.array([m.get(field.name) for m in messages]).cast(field.type) for field in MESSAGE_SCHEMA],
+            schema=MESSAGE_SCHEMA,
+        )
+    except (pa.ArrowInvalid, pa.ArrowTypeError, pa.ArrowNotImplementedError) as e:
+        logging.error(f"API data does not match the messages schema: {e}")
+        return
+
     if os.path.exists(DB_FILE):
         os.remove(DB_FILE)
         logging.info(f"Removed old {DB_FILE}.")
+    if os.path.exists(INDEX_META_FILE):
+        # Rowids restart with the new table, so the next index.py run must
+        # rebuild rather than append after the old last_rowid.
+        os.remove(INDEX_META_FILE)
+        logging.info(f"Removed stale {INDEX_META_FILE}.")
 
     logging.info(f"Creating new database: {DB_FILE}")
 
-    df = pd.DataFrame(messages)
-    
-    # --- THIS IS THE FIX ---
-    # Treat timestamp as a string to handle timezone info gracefully.
-    df = df.astype({
-        'user_id': 'string',
-        'user_name': 'string',
-        'message': 'string',
-        'timestamp': 'string' # Was 'datetime64[ns]'
-    })
-    # --- END FIX ---
-
     with duckdb.connect(DB_FILE) as con:
-        con.register('messages_df', df)
+        con.register('messages_df', tbl)
         con.execute("CREATE TABLE messages AS SELECT * FROM messages_df")
         
-        logging.info(f"Successfully inserted {len(df)} messages into 'messages' table.")
+        logging.info(f"Successfully inserted {tbl.num_rows} messages into 'messages' table.")
         
         logging.info("--- Bonus 2: Data Insights (from DB) ---")
         
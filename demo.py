@@ -1,8 +1,11 @@
 import gradio as gr
-import requests
-import json
+import httpx
+import orjson
 import logging
 import os # Make sure os is imported
+import re
+import time
+from typing import Optional
 from datetime import datetime # Make sure datetime is imported
 
 # --- 1. SET UP PROFESSIONAL LOGGING ---
@@ -11,13 +14,102 @@ logger = logging.getLogger(__name__)
 # ---
 
 # --- Configuration ---
-# We use an env var for the API URL to make it flexible
-# Fallback to localhost if not set
-API_URL = os.getenv("API_URL", "http://127.0.0.1:8000/ask")
+# API_URL comes from config.py (env var, with a localhost fallback)
+from config import API_URL
+# Server-Sent Events variant of /ask; answer tokens arrive as they're generated.
+API_STREAM_URL = os.getenv("API_STREAM_URL", API_URL.rstrip("/") + "/stream")
 logger.info(f"Connecting Gradio Demo to API Server: {API_URL}")
 
+# HTTP/2 multiplexes concurrent queries over one connection; it needs the
+# optional h2 package (pip install "httpx[http2]"), else HTTP/1.1 pooling.
+try:
+    import h2  # noqa: F401
+    HTTP2_ENABLED = True
+except ImportError:
+    HTTP2_ENABLED = False
+
+# One keep-alive client for the whole process, so repeated submissions
+# reuse the same connection instead of reconnecting on every click.
+# Created on first use, inside Gradio's event loop (see demo.load below).
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """Returns the shared client, creating it on first call."""
+    global _client
+    if _client is None or _client.is_closed:
+        # Split timeout: fail fast on connect and pool waits, allow 20 s for
+        # the agent. The transport retries failed connection attempts.
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(connect=2.0, read=20.0, write=5.0, pool=2.0),
+            transport=httpx.AsyncHTTPTransport(
+                retries=2,
+                http2=HTTP2_ENABLED,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100),
+            ),
+        )
+        logger.info(f"Created shared HTTP client (http2={HTTP2_ENABLED})")
+    return _client
+
+
+async def warm_client():
+    """Page-load hook: builds the shared client before the first query."""
+    get_client()
 
-def run_agent_demo(question):
+# Cap intermediate UI updates at ~25 Hz. High-frequency yields from a
+# Gradio generator pin the browser's CPU and leave the UI lagging.
+MIN_YIELD_INTERVAL = 0.04
+
+
+class _YieldThrottle:
+    """
+    Rate limiter for intermediate yields in a streaming handler.
+    Final states should always be yielded; only call ready() for
+    in-progress updates that can be coalesced into the next one.
+    """
+
+    def __init__(self, interval: float = MIN_YIELD_INTERVAL):
+        self.interval = interval
+        self._last = float("-inf")
+
+    def ready(self) -> bool:
+        now = time.monotonic()
+        if now - self._last >= self.interval:
+            self._last = now
+            return True
+        return False
+
+
+# Updates that never vary are built once and shared by every response.
+SHOWN = gr.update(visible=True)
+HIDDEN = gr.update(visible=False)
+CLEAR = gr.update(value="")
+NO_RECOMMENDATION_TEXT = (
+    "ℹ️ No actionable recommendation for this query. "
+    "The agent focuses on preference-related suggestions."
+)
+
+
+def _reply(answer, raw_json, rec_visible, rec_text="", confirm_text=None,
+           confirm_variant="primary", show_buttons=False):
+    """Builds the updates for every output component once a query finishes."""
+    return {
+        output_answer: gr.update(value=answer, visible=True),
+        output_raw_json: gr.update(value=raw_json, visible=True),
+        output_recommendation_group: SHOWN if rec_visible else HIDDEN,
+        output_recommendation_text: (
+            gr.update(value=rec_text, visible=True) if rec_visible else CLEAR
+        ),
+        confirm_button: (
+            gr.update(value=confirm_text, variant=confirm_variant, visible=True)
+            if show_buttons else HIDDEN
+        ),
+        reject_button: SHOWN if show_buttons else HIDDEN,
+        output_feedback_status: CLEAR
+    }
+
+
+async def run_agent_demo(question):
     """
     Executes the agent query with professional error handling.
     
@@ -34,8 +126,8 @@ def run_agent_demo(question):
     yield {
         output_answer: gr.update(value="⏳ Processing query...", visible=True),
         output_raw_json: gr.update(value=None, visible=False),
-        output_recommendation_group: gr.update(visible=False),
-        output_feedback_status: gr.update(value=""), # Clear old status
+        output_recommendation_group: HIDDEN,
+        output_feedback_status: CLEAR, # Clear old status
     }
     
     # Validate input
@@ -46,104 +138,80 @@ def run_agent_demo(question):
         return
 
     try:
-        # Call API with timeout
-        response = requests.post(
-            API_URL, 
-            json={"question": question}, 
-            timeout=20
-        )
-        response.raise_for_status()
-        
-        data = response.json()
+        # Stream from the API (timeout is configured on the shared client)
+        data = None
+        partial_answer = ""
+        throttle = _YieldThrottle()
+        async with get_client().stream(
+            "POST",
+            API_STREAM_URL, 
+            json={"question": question}
+        ) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                event = orjson.loads(line[len("data: "):])
+
+                if event["type"] == "token":
+                    partial_answer += event["delta"]
+                    # Coalesce tokens between ticks into the next update.
+                    if throttle.ready():
+                        yield {output_answer: gr.update(value=partial_answer, visible=True)}
+                elif event["type"] == "final":
+                    data = event["response"]
+                elif event["type"] == "error":
+                    raise RuntimeError(event["message"])
+
+        if data is None:
+            raise RuntimeError("Stream ended without a final response.")
         logger.info(f"[API] Response received successfully")
         
         # Extract response components
         answer = data.get("answer", "No answer available.")
-        pretty_json = json.dumps(data, indent=2)
+        # gr.JSON renders dicts itself; no need to re-serialize the body here.
         recommendation = data.get("proactive_recommendation")
         
         # Handle recommendation display
         if recommendation:
             logger.info("[Recommendation] Proactive suggestion detected")
-            suggestion_text = recommendation.get("suggestion_text", "")
             action_id = recommendation.get("action_id", "")
             
             # Dynamic button text based on action type
             if "save_preference" in action_id:
-                yes_button_text = "Save Preference"
-                button_variant = "primary"
+                yes_button_text, button_variant = "Save Preference", "primary"
             elif "trip_itinerary" in action_id:
-                yes_button_text = "Start Itinerary"
-                button_variant = "secondary"
+                yes_button_text, button_variant = "Start Itinerary", "secondary"
             else:
-                yes_button_text = "Confirm"
-                button_variant = "primary"
+                yes_button_text, button_variant = "Confirm", "primary"
             
-            yield {
-                output_answer: gr.update(value=answer, visible=True),
-                output_raw_json: gr.update(value=pretty_json, visible=True),
-                output_recommendation_group: gr.update(visible=True),
-                output_recommendation_text: gr.update(
-                    value=suggestion_text, 
-                    visible=True
-                ),
-                confirm_button: gr.update(
-                    value=yes_button_text, 
-                    variant=button_variant,
-                    visible=True
-                ),
-                reject_button: gr.update(visible=True),
-                output_feedback_status: gr.update(value="")
-            }
+            yield _reply(
+                answer, data, True,
+                rec_text=recommendation.get("suggestion_text", ""),
+                confirm_text=yes_button_text,
+                confirm_variant=button_variant,
+                show_buttons=True
+            )
         else:
             # Graceful fallback for queries without recommendations
             logger.info("[Recommendation] No actionable suggestion for this query")
-            yield {
-                output_answer: gr.update(value=answer, visible=True),
-                output_raw_json: gr.update(value=pretty_json, visible=True),
-                output_recommendation_group: gr.update(visible=True),
-                output_recommendation_text: gr.update(
-                    value="ℹ️ No actionable recommendation for this query. The agent focuses on preference-related suggestions.",
-                    visible=True
-                ),
-                confirm_button: gr.update(visible=False),
-                reject_button: gr.update(visible=False),
-                output_feedback_status: gr.update(value="")
-            }
+            yield _reply(answer, data, True, rec_text=NO_RECOMMENDATION_TEXT)
             
-    except requests.exceptions.Timeout:
+    except httpx.TimeoutException:
         logger.error("[API] Request timeout")
-        yield {
-            output_answer: gr.update(
-                value="Request timeout. Please ensure the API server is running and try again.",
-                visible=True
-            ),
-            output_raw_json: gr.update(value=json.dumps({"error": "timeout"}, indent=2), visible=True),
-            output_recommendation_group: gr.update(visible=False),
-            output_recommendation_text: gr.update(value=""),
-            output_feedback_status: gr.update(value="")
-        }
-    except requests.exceptions.ConnectionError:
+        yield _reply(
+            "Request timeout. Please ensure the API server is running and try again.",
+            {"error": "timeout"}, False
+        )
+    except httpx.ConnectError:
         logger.error("[API] Connection failed")
-        yield {
-            output_answer: gr.update(
-                value="Cannot connect to API server. Please start the server with: python main.py",
-                visible=True
-            ),
-            output_raw_json: gr.update(value=json.dumps({"error": "connection_refused"}, indent=2), visible=True),
-            output_recommendation_group: gr.update(visible=False),
-            output_recommendation_text: gr.update(value=""),
-            output_feedback_status: gr.update(value="")
-        }
+        yield _reply(
+            "Cannot connect to API server. Please start the server with: python main.py",
+            {"error": "connection_refused"}, False
+        )
     except Exception as e:
         logger.error(f"[API] Unexpected error: {e}", exc_info=True) # Added exc_info=True
-        yield {
-            output_answer: gr.update(value=f"Error: {str(e)}", visible=True),
-            output_raw_json: gr.update(value=json.dumps({"error": str(e)}, indent=2), visible=True),
-            output_recommendation_group: gr.update(visible=False),
-            output_recommendation_text: gr.update(value=""),
-            output_feedback_status: gr.update(value="")
-        }
+        yield _reply(f"Error: {str(e)}", {"error": str(e)}, False)
 
 
 def on_confirm_recommendation():
@@ -317,6 +385,17 @@ button.secondary-action:hover {
 """
 
 
+def _minify_css(css: str) -> str:
+    """Strips comments and redundant whitespace, once, at startup."""
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    return re.sub(r"\s+", " ", css).replace(";}", "}").strip()
+
+
+# Sent inline with every page load, so ship the compact form.
+custom_css = _minify_css(custom_css)
+
+
 # --- Build Enterprise-Grade Interface (FIXED THEME) ---
 with gr.Blocks(
     theme=gr.themes.Base(
@@ -454,11 +533,20 @@ with gr.Blocks(
         outputs=[output_feedback_status]
     )
 
+    # Build the shared client on page load. It is deliberately not closed on
+    # demo.unload, which fires per browser session, not at process exit.
+    demo.load(fn=warm_client, inputs=None, outputs=None, queue=False)
+
 
 # --- Launch Configuration ---
 if __name__ == "__main__":
     logger.info("Launching Gradio Demo Interface...")
-    demo.launch(
+    # Queue events so streamed updates from concurrent sessions interleave
+    # instead of serializing behind one another.
+    demo.queue(
+        default_concurrency_limit=int(os.getenv("GRADIO_CONCURRENCY_LIMIT", "8")),
+        max_size=int(os.getenv("GRADIO_QUEUE_MAX_SIZE", "32")),
+    ).launch(
     server_name=os.getenv("GRADIO_SERVER_NAME", "127.0.0.1"),
     server_port=int(os.getenv("GRADIO_SERVER_PORT", "7860")),
     )
\ No newline at end of file
@@ -1,7 +1,11 @@
+import argparse
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
 import json
 import logging
-from typing import List, Dict
+from typing import Any, List, Dict
 
 # --- 1. SET UP PROFESSIONAL LOGGING ---
 logging.basicConfig(
@@ -11,8 +15,33 @@ logging.basicConfig(
 
 # --- Configuration ---
 EVAL_FILE = "eval.json"
-# We test our local server running on port 8080
-API_URL = "http://127.0.0.1:8080/ask" 
+# The live server under test; set API_URL to point elsewhere
+from config import API_URL
+# (connect, read): fail fast if the server is down, wait for slow answers.
+REQUEST_TIMEOUT = (3.05, 20)
+# Tests are independent, so several can be in flight at once.
+DEFAULT_WORKERS = 8
+
+# Transient gateway errors and failed connects are retried with backoff
+# (0.3 s, 0.6 s) instead of failing the test. POST is not retried by default.
+# Read timeouts are not retried: the server may still be answering, and a
+# resend would double the Gemini spend and skew the measured latency.
+RETRY = Retry(
+    total=2,
+    connect=2,
+    read=0,
+    status=2,
+    backoff_factor=0.3,
+    status_forcelist=[502, 503, 504],
+    allowed_methods=["POST"],
+    raise_on_status=False
+)
+
+# One pooled keep-alive session for every test request against the same host.
+SESSION = requests.Session()
+_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=RETRY)
+SESSION.mount("http://", _adapter)
+SESSION.mount("https://", _adapter)
 
 def load_eval_set() -> List[Dict]:
     """Loads the golden evaluation set from JSON."""
@@ -26,9 +55,22 @@ def load_eval_set() -> List[Dict]:
         logging.error(f"FATAL: Could not parse {EVAL_FILE}. Check for syntax errors.")
         return None
 
-def run_evaluation():
+def ask(question: str) -> Any:
+    """
+    Sends one question to the live API.
+    Returns the agent's answer, or the exception if the call failed.
+    """
+    try:
+        response = SESSION.post(API_URL, json={"question": question}, timeout=REQUEST_TIMEOUT)
+        response.raise_for_status()
+        return response.json().get("answer")
+    except Exception as e:
+        return e
+
+def run_evaluation(workers: int = DEFAULT_WORKERS):
     """
     Runs the full evaluation against the live API.
+    Requests are issued concurrently; results are scored in order.
     """
     logging.info("--- Starting Agent Evaluation ---")
     
@@ -36,12 +78,16 @@ def run_evaluation():
     if not eval_set:
         return
 
-    logging.info(f"Loaded {len(eval_set)} test questions.")
+    logging.info(f"Loaded {len(eval_set)} test questions. Running with {workers} workers.")
+    
+    # 1. Call our live API, all tests at once (map keeps input order)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as executor:
+        agent_answers = list(executor.map(ask, [test['question'] for test in eval_set]))
     
     score = 0
     total = len(eval_set)
     
-    for i, test in enumerate(eval_set):
+    for i, (test, agent_answer) in enumerate(zip(eval_set, agent_answers)):
         question = test['question']
         golden_answer = test['golden_answer']
         
@@ -49,29 +95,23 @@ def run_evaluation():
         logging.info(f"QUESTION: {question}")
         logging.info(f"EXPECTED: {golden_answer}")
         
-        try:
-            # 1. Call our live API
-            response = requests.post(API_URL, json={"question": question}, timeout=20)
-            response.raise_for_status()
-            
-            response_data = response.json()
-            agent_answer = response_data.get("answer")
-            
-            logging.info(f"AGENT:    {agent_answer}")
-            
-            # 2. Check the answer (simple "contains" check)
-            if golden_answer.lower() in agent_answer.lower():
-                logging.info("RESULT: PASS")
-                score += 1
-            else:
-                logging.info("RESULT: FAIL")
-                
-        except requests.exceptions.RequestException as e:
-            logging.error(f"API request failed: {e}")
+        if isinstance(agent_answer, requests.exceptions.RequestException):
+            logging.error(f"API request failed: {agent_answer}")
             logging.info("RESULT: ERROR (Skipping)")
-        except Exception as e:
-            logging.error(f"An unexpected error occurred: {e}")
+            continue
+        if isinstance(agent_answer, Exception):
+            logging.error(f"An unexpected error occurred: {agent_answer}")
             logging.info("RESULT: ERROR (Skipping)")
+            continue
+        
+        logging.info(f"AGENT:    {agent_answer}")
+        
+        # 2. Check the answer (simple "contains" check)
+        if agent_answer and golden_answer.lower() in agent_answer.lower():
+            logging.info("RESULT: PASS")
+            score += 1
+        else:
+            logging.info("RESULT: FAIL")
 
     # --- 3. Show Final Score ---
     logging.info("\n--- Evaluation Complete ---")
@@ -82,6 +122,13 @@ def run_evaluation():
         logging.info("No tests were run.")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Evaluate the agent against the golden set.")
+    parser.add_argument(
+        "--workers", type=int, default=DEFAULT_WORKERS,
+        help=f"Number of concurrent requests (default: {DEFAULT_WORKERS})."
+    )
+    args = parser.parse_args()
+
     # Make sure your main.py server is running in another terminal!
     logging.info(f"Connecting to API server at {API_URL}...")
-    run_evaluation()
\ No newline at end of file
+    run_evaluation(workers=args.workers)
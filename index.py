@@ -2,9 +2,16 @@ import duckdb
 from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import torch
+import argparse
+import json
 import logging
+import math
 import os
-from typing import List, Tuple
+import tempfile
+from typing import Any, Dict, Optional, Tuple
 
 # --- 1. SET UP PROFESSIONAL LOGGING ---
 logging.basicConfig(
@@ -13,45 +20,181 @@ logging.basicConfig(
 )
 
 # --- Configuration ---
-DB_FILE = "data.db"
-INDEX_FILE = "index.faiss"
-MODEL_NAME = 'all-MiniLM-L6-v2'
-# Use a batch size for encoding, good for memory efficiency
-EMBEDDING_BATCH_SIZE = 64 
+from config import DB_FILE, INDEX_FILE, INDEX_META_FILE, MODEL_NAME
+# MiniLM is small; 256 keeps a GPU busy and is still modest on CPU memory
+EMBEDDING_BATCH_SIZE = 256
+EMBEDDING_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
-def get_data_for_indexing() -> List[Tuple[str, str, str]]:
+# Index type is chosen by corpus size and recorded in INDEX_META_FILE so the
+# query side can apply the matching search parameters.
+HNSW_THRESHOLD = 10_000    # N >= this: graph search instead of brute force
+IVFPQ_THRESHOLD = 100_000  # N >= this: compressed inverted lists
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+PQ_M = 48       # sub-quantizers; must divide the embedding dimension
+PQ_NBITS = 8
+IVF_NPROBE = 16
+TRAIN_SAMPLE_SIZE = 100_000
+
+def get_data_for_indexing(after_rowid: int = -1) -> Optional[pa.Table]:
     """
-    Fetches all data needed for indexing from the database.
-    We'll get rowid, user_name, and message.
+    Fetches the data needed for indexing from the database: every row with
+    a rowid above after_rowid (all rows by default).
+    We'll get rowid, user_name, and message, as columns (an Arrow table)
+    rather than one Python tuple per row.
     """
     logging.info(f"Connecting to {DB_FILE} to fetch messages...")
     if not os.path.exists(DB_FILE):
         logging.error(f"Database file not found: {DB_FILE}")
         logging.error("Please run 'python data_loader.py' first.")
-        return []
+        return None
         
     try:
         with duckdb.connect(DB_FILE, read_only=True) as con:
             # Get the rowid, which is crucial for mapping
             # FAISS index back to the database row.
             messages = con.execute(
-                "SELECT rowid, user_name, message FROM messages"
-            ).fetchall()
+                "SELECT rowid, user_name, message FROM messages WHERE rowid > ? ORDER BY rowid",
+                [after_rowid]
+            ).fetch_arrow_table()
         
-        logging.info(f"Successfully fetched {len(messages)} messages from database.")
+        logging.info(f"Successfully fetched {messages.num_rows} messages from database.")
         return messages
     except Exception as e:
         logging.error(f"Failed to read from DuckDB: {e}")
-        return []
+        return None
+
+def index_type_for(n: int) -> str:
+    """Returns the index tier build_index uses for a corpus of n vectors."""
+    if n < HNSW_THRESHOLD:
+        return "sq8"
+    if n < IVFPQ_THRESHOLD:
+        return "hnsw"
+    return "ivfpq"
+
+
+def build_index(embeddings: np.ndarray, ids: np.ndarray) -> Tuple[faiss.Index, Dict[str, Any]]:
+    """
+    Picks an index type for the corpus size and fills it:
+    - N < HNSW_THRESHOLD:  IndexScalarQuantizer (8-bit), brute force over
+                           int8 codes (4x less memory, SIMD int8 kernels).
+    - N < IVFPQ_THRESHOLD: IndexHNSWFlat, sub-linear graph search.
+    - otherwise:           IndexIVFPQ, 8-bit PQ codes (8-16x less memory).
+    All use inner product on normalized vectors (cosine similarity), and are
+    wrapped in an IndexIDMap2 keyed by DuckDB rowid so later appends stay
+    aligned with the table.
+    Returns the index and the metadata to persist alongside it.
+    """
+    n, dimension = embeddings.shape
+    index_type = index_type_for(n)
+
+    if index_type == "sq8":
+        # Brute force because the corpus is tiny.
+        # This is an "engineering trade-off": it's faster and more accurate
+        # than a complex index at this small scale. Normalized MiniLM
+        # components fit 8-bit codes with well under 1% recall loss.
+        index = faiss.IndexScalarQuantizer(
+            dimension, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        # Training only learns the per-dimension value ranges; it's cheap.
+        index.train(embeddings)
+        meta = {"type": "sq8"}
+
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, HNSW_M, faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        meta = {"type": "hnsw", "m": HNSW_M, "ef_search": HNSW_EF_SEARCH}
+
+    else:
+        nlist = int(4 * math.sqrt(n))
+        pq_m = max(m for m in range(1, PQ_M + 1) if dimension % m == 0)
+        factory = f"IVF{nlist},PQ{pq_m}x{PQ_NBITS}"
+        index = faiss.index_factory(dimension, factory, faiss.METRIC_INNER_PRODUCT)
+        # Train on a sample; k-means over the full corpus buys little.
+        rng = np.random.default_rng(0)
+        sample = embeddings[rng.choice(n, size=min(n, TRAIN_SAMPLE_SIZE), replace=False)]
+        logging.info(f"Training IVFPQ (nlist={nlist}, m={pq_m}) on {len(sample)} vectors...")
+        index.train(sample)
+        meta = {"type": "ivfpq", "factory": factory, "nlist": nlist, "m": pq_m, "nbits": PQ_NBITS, "nprobe": IVF_NPROBE}
+
+    # Add all our vectors to the index, under their rowids
+    index = faiss.IndexIDMap2(index)
+    index.add_with_ids(embeddings, ids)
+    meta.update({"metric": "inner_product", "dimension": dimension, "ntotal": int(index.ntotal)})
+    return index, meta
+
+
+def load_existing_index() -> Optional[Tuple[faiss.Index, Dict[str, Any]]]:
+    """
+    Loads the saved index and its metadata for an incremental update.
+    Returns None when there is nothing usable to append to (missing files,
+    an index from before rowid tracking, or a different embedding model).
+    """
+    if not (os.path.exists(INDEX_FILE) and os.path.exists(INDEX_META_FILE)):
+        return None
+
+    try:
+        with open(INDEX_META_FILE, "r") as f:
+            meta = json.load(f)
+        if "last_rowid" not in meta or meta.get("model") != MODEL_NAME:
+            return None
+        return faiss.read_index(INDEX_FILE), meta
+    except Exception as e:
+        logging.warning(f"Could not load existing index ({e}); rebuilding.")
+        return None
+
+
+def _temp_path_for(path: str) -> str:
+    """A fresh temp file next to path, so os.replace onto it is atomic."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+    os.close(fd)
+    return tmp_path
+
+
+def save_index(index: faiss.Index, meta: Dict[str, Any]) -> None:
+    """
+    Writes both files to temp files, then swaps them in with os.replace.
+    A running server memory-maps INDEX_FILE, so it must never be rewritten
+    in place: the old inode stays valid for it, and new readers see either
+    the old file or the complete new one. Both are written before either is
+    swapped (meta first), so a failed write leaves the old pair intact.
+    """
+    index_tmp = _temp_path_for(INDEX_FILE)
+    meta_tmp = _temp_path_for(INDEX_META_FILE)
+    try:
+        faiss.write_index(index, index_tmp)
+        with open(meta_tmp, "w") as f:
+            json.dump(meta, f, indent=2)
+        os.replace(meta_tmp, INDEX_META_FILE)
+        os.replace(index_tmp, INDEX_FILE)
+    finally:
+        for tmp_path in (index_tmp, meta_tmp):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
 
-def create_index():
+def create_index(full_rebuild: bool = False):
     """
     Creates a robust FAISS index from the messages in DuckDB.
+    Unless full_rebuild is set, an existing index is updated in place:
+    only rows added since the last run are embedded and appended.
     """
-    messages_data = get_data_for_indexing()
-    if not messages_data:
+    existing = None if full_rebuild else load_existing_index()
+    after_rowid = existing[1]["last_rowid"] if existing else -1
+    if existing:
+        logging.info(f"Updating existing index with rows after rowid {after_rowid}.")
+
+    messages_data = get_data_for_indexing(after_rowid)
+    if messages_data is None:
         logging.error("No data to index. Exiting.")
         return
+    if messages_data.num_rows == 0:
+        if existing:
+            logging.info("Index is already up to date.")
+        else:
+            logging.error("No data to index. Exiting.")
+        return
 
     try:
         logging.info(f"Loading embedding model '{MODEL_NAME}'...")
@@ -62,41 +205,60 @@ def create_index():
 
     # Create the text we'll embed. We'll keep the rowids separate for mapping.
     # We combine user_name and message for better contextual search
-    message_texts = [f"{user}: {text}" for rowid, user, text in messages_data]
+    # (joined column-wise in Arrow; only the final strings become Python objects)
+    message_texts = pc.binary_join_element_wise(
+        messages_data["user_name"], messages_data["message"], ": ",
+        null_handling="replace"
+    ).to_pylist()
+    rowids = messages_data["rowid"].to_numpy().astype(np.int64)
     
-    logging.info(f"Creating embeddings for {len(message_texts)} messages...")
+    logging.info(f"Creating embeddings for {len(message_texts)} messages on {EMBEDDING_DEVICE}...")
     
     try:
+        # Ask for a float32 ndarray up front and let the model L2-normalize
+        # inside its pooling step, so no extra pass over N x D is needed.
         embeddings = model.encode(
             message_texts, 
             batch_size=EMBEDDING_BATCH_SIZE, 
-            show_progress_bar=True
+            device=EMBEDDING_DEVICE,
+            show_progress_bar=True,
+            convert_to_numpy=True,
+            normalize_embeddings=True
         )
     except Exception as e:
         logging.error(f"Failed during model.encode: {e}")
         return
 
-    # FAISS requires float32
-    embeddings = np.array(embeddings).astype('float32')
+    # FAISS requires float32; this is a no-op view when it already is.
+    embeddings = np.asarray(embeddings, dtype=np.float32)
 
-    # Get the vector dimension from the first embedding
-    dimension = embeddings.shape[1]
-    
-    logging.info(f"Creating FAISS Index (Dimension: {dimension})...")
-    # Using IndexFlatL2 (brute-force) because 3.3k items is tiny.
-    # This is an "engineering trade-off": it's faster and more accurate
-    # than a complex index at this small scale.
-    index = faiss.IndexFlatL2(dimension)
-    
-    # Add all our vectors to the index
-    index.add(embeddings)
-    
-    logging.info(f"Index created. Total vectors: {index.ntotal}")
+    if existing:
+        index, meta = existing
+        if index_type_for(index.ntotal + len(rowids)) != meta["type"]:
+            # The corpus outgrew its tier; the new type needs a fresh build.
+            logging.info("Corpus has outgrown the current index type. Rebuilding.")
+            return create_index(full_rebuild=True)
+        index.add_with_ids(embeddings, rowids)
+        meta["ntotal"] = int(index.ntotal)
+        logging.info(f"Appended {len(rowids)} vectors ({meta['type']}). Total vectors: {index.ntotal}")
+    else:
+        # Get the vector dimension from the first embedding
+        dimension = embeddings.shape[1]
+        
+        logging.info(f"Creating FAISS Index (Dimension: {dimension})...")
+        # Embeddings are unit-length, so inner product == cosine similarity,
+        # which is the metric MiniLM was trained for.
+        index, meta = build_index(embeddings, rowids)
+        
+        logging.info(f"Index created ({meta['type']}). Total vectors: {index.ntotal}")
+
+    # Where the next incremental run picks up
+    meta.update({"model": MODEL_NAME, "last_rowid": int(rowids.max())})
 
-    # Save the index to our disk
+    # Save the index (and how to search it) to our disk
     try:
         logging.info(f"Saving index to {INDEX_FILE}...")
-        faiss.write_index(index, INDEX_FILE)
+        save_index(index, meta)
     except Exception as e:
         logging.error(f"Failed to write index file: {e}")
         return
@@ -105,4 +267,10 @@ def create_index():
     logging.info(f"File '{INDEX_FILE}' is ready.")
 
 if __name__ == "__main__":
-    create_index()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Build or update the FAISS index.")
+    parser.add_argument(
+        "--full", action="store_true",
+        help="Re-embed every message instead of only the new ones."
+    )
+    args = parser.parse_args()
+    create_index(full_rebuild=args.full)
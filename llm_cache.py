@@ -0,0 +1,72 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+from typing import Optional
+
+# --- 1. LOGGING ---
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONFIGURATION ---
+
+CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join("data", "llm_cache"))
+# Bump whenever a prompt template changes so stale answers are never served.
+PROMPT_VERSION = "v1"
+
+
+# --- 3. CONTENT-ADDRESSABLE LOOKUP ---
+# get and set do blocking file I/O; call them via asyncio.to_thread from
+# async code.
+
+def _cache_path(prompt: str, model_name: str) -> str:
+    """Maps (model, prompt version, prompt) to a SHA-256 named file."""
+    key = hashlib.sha256(
+        (model_name + PROMPT_VERSION + prompt).encode("utf-8")
+    ).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+
+def get(prompt: str, model_name: str) -> Optional[str]:
+    """
+    Returns the cached response text for this prompt, or None on a miss.
+    Unreadable entries are treated as misses.
+    """
+    path = _cache_path(prompt, model_name)
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            text = json.load(f)["text"]
+        logger.debug("[LLM_Cache] Hit: %s", os.path.basename(path))
+        return text
+    except Exception as e:
+        logger.warning(f"[LLM_Cache] Could not read {path}: {e}")
+        return None
+
+
+def set(prompt: str, text: str, model_name: str) -> None:
+    """
+    Stores a response on disk. Failures are logged and swallowed;
+    the cache must never break a live request.
+    """
+    path = _cache_path(prompt, model_name)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # A unique tmp file per writer: concurrent sets of the same prompt
+        # (other threads or workers) must not interleave into one file.
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"text": text, "created": time.time()}, f)
+            # Atomic rename so concurrent readers never see a partial file.
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    except Exception as e:
+        logger.warning(f"[LLM_Cache] Could not write {path}: {e}")
@@ -1,30 +1,59 @@
 import uvicorn
 from fastapi import FastAPI
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse, StreamingResponse
 from pydantic import BaseModel
+import asyncio
+import atexit
 import logging
 import os
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 import duckdb
+import orjson
 
-from agent import run_agent
-from tools import FAISS_INDEX, DB_FILE 
+from agent import run_agent, run_agent_stream
+from config import DB_FILE
+import tools
+from tools import FAISS_INDEX
 
 # --- 1. PRODUCTION LOGGING (CONSOLE ONLY - SIMPLE & CLEAN) ---
+# Only the stderr write moves to the listener thread, so slow console I/O
+# never blocks a request. Formatting still happens on the logging thread
+# (QueueHandler.prepare merges args into the message before enqueueing), so
+# keep per-request logs at DEBUG and use %-style args.
+_log_console = logging.StreamHandler()
+_log_console.setFormatter(
+    logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+)
+_log_queue: queue.Queue = queue.Queue(-1)
 logging.basicConfig(
     level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[QueueHandler(_log_queue)],
     force=True
 )
+_log_listener = QueueListener(_log_queue, _log_console, respect_handler_level=True)
+_log_listener.start()
+atexit.register(_log_listener.stop)  # flushes queued records on exit
 
 logger = logging.getLogger(__name__)
 
 
+# Threads available to the agent's blocking tool calls (asyncio.to_thread).
+AGENT_THREADPOOL_SIZE = int(os.environ.get("AGENT_THREADPOOL_SIZE", "32"))
+# How long /health may serve a cached message count before re-querying.
+HEALTH_CACHE_TTL = float(os.environ.get("HEALTH_CACHE_TTL", "5"))
+
+
 # --- 2. CREATE THE FASTAPI APP ---
 app = FastAPI(
     title="Proactive Q&A Agent API",
     description="Production-ready agentic RAG system with intelligent routing between SQL and vector search.",
-    version="1.0.0"
+    version="1.0.0",
+    # orjson encodes in C and writes bytes directly; it also handles datetime.
+    default_response_class=ORJSONResponse
 )
 
 
@@ -34,6 +63,30 @@ class QueryRequest(BaseModel):
 
 
 # --- 4. HEALTH CHECK ENDPOINT ---
+def _message_count() -> int:
+    """
+    Returns the message count from the connection opened at startup,
+    re-querying at most once per HEALTH_CACHE_TTL seconds.
+    Raises if the database is unavailable.
+    """
+    now = time.monotonic()
+    if (
+        app.state.message_count is not None
+        and now - app.state.message_count_at < HEALTH_CACHE_TTL
+    ):
+        return app.state.message_count
+
+    if app.state.duck is None:
+        # DB was missing at startup; try again so /health can recover.
+        app.state.duck = duckdb.connect(DB_FILE, read_only=True)
+
+    result = app.state.duck.cursor().execute("SELECT COUNT(*) FROM messages").fetchone()
+    app.state.message_count = result[0] if result else 0
+    app.state.message_count_at = now
+    return app.state.message_count
+
+
+
 @app.get("/health", tags=["Health"])
 async def health_check():
     """
@@ -47,7 +100,7 @@ async def health_check():
     health_status = {
         "status": "ok",
         "components": {},
-        "timestamp": datetime.now().isoformat(),
+        "timestamp": datetime.now(),
         "version": "1.0.0"
     }
 
@@ -60,24 +113,24 @@ async def health_check():
         else:
             health_status["components"]["faiss_index"] = {
                 "status": "ok",
-                "vectors": FAISS_INDEX.ntotal
+                "vectors": FAISS_INDEX.ntotal,
+                "batching": tools.CONTEXT_BATCHER.metrics(),
+                "cache": tools.tool_cache_info()
             }
 
         # Check database connection
         try:
-            with duckdb.connect(DB_FILE, read_only=True) as con:
-                result = con.execute("SELECT COUNT(*) FROM messages").fetchone()
-                health_status["components"]["database"] = {
-                    "status": "ok",
-                    "message_count": result[0] if result else 0
-                }
+            health_status["components"]["database"] = {
+                "status": "ok",
+                "message_count": _message_count()
+            }
         except Exception as db_error:
             health_status["status"] = "error"
             health_status["components"]["database"] = {
                 "status": "error",
                 "error": str(db_error)
             }
-            logger.error(f"Health check: Database error - {db_error}")
+            logger.error("Health check: Database error - %s", db_error)
 
         # Check environment variables
         if not os.getenv("GEMINI_API_KEY"):
@@ -89,23 +142,23 @@ async def health_check():
 
         # Return appropriate status code
         if health_status["status"] == "ok":
-            logger.info("Health check successful - all systems operational")
-            return JSONResponse(status_code=200, content=health_status)
+            logger.debug("Health check successful - all systems operational")
+            return ORJSONResponse(status_code=200, content=health_status)
         elif health_status["status"] == "degraded":
             logger.warning("Health check degraded - some components have issues")
-            return JSONResponse(status_code=200, content=health_status)
+            return ORJSONResponse(status_code=200, content=health_status)
         else:
             logger.error("Health check failed - critical errors detected")
-            return JSONResponse(status_code=503, content=health_status)
+            return ORJSONResponse(status_code=503, content=health_status)
 
     except Exception as e:
-        logger.error(f"Health check failed with exception: {e}", exc_info=True)
-        return JSONResponse(
+        logger.error("Health check failed with exception: %s", e, exc_info=True)
+        return ORJSONResponse(
             status_code=503,
             content={
                 "status": "error",
                 "message": str(e),
-                "timestamp": datetime.now().isoformat()
+                "timestamp": datetime.now()
             }
         )
 
@@ -114,7 +167,7 @@ async def health_check():
 @app.get("/", tags=["Health"])
 async def root_health_check():
     """Simple health check at root endpoint."""
-    logger.info("Root health check accessed")
+    logger.debug("Root health check accessed")
     return {"status": "ok", "message": "Agent is live and ready."}
 
 
@@ -128,23 +181,16 @@ async def ask_agent(request: QueryRequest):
     synthesizes responses, and provides proactive recommendations.
     """
     try:
-        logger.info(f"Received query: {request.question}")
-        response = run_agent(request.question)
-
-        # Log the tool used
-        trace = response.get("reasoning_trace", [])
-        tool_used = "unknown"
-        if "Fact_Seeker" in str(trace):
-            tool_used = "Fact_Seeker (SQL)"
-        elif "Context_Seeker" in str(trace):
-            tool_used = "Context_Seeker (Vector)"
-        
-        logger.info(f"Query processed successfully. Tool used: {tool_used}")
+        logger.debug("Received query: %s", request.question)
+        response = await run_agent(request.question)
+
+        # Log the tool used (reported by the router itself)
+        logger.debug("Query processed successfully. Tool used: %s", response.get("tool_used", "unknown"))
         return response
         
     except Exception as e:
-        logger.error(f"Error during /ask endpoint: {e}", exc_info=True)
-        return JSONResponse(
+        logger.error("Error during /ask endpoint: %s", e, exc_info=True)
+        return ORJSONResponse(
             status_code=500,
             content={
                 "answer": "I'm sorry, I encountered a critical server error.",
@@ -155,10 +201,56 @@ async def ask_agent(request: QueryRequest):
         )
 
 
-# --- 7. STARTUP EVENT ---
+# --- 7. STREAMING AGENT ENDPOINT ---
+async def _sse_events(question: str):
+    """Wraps run_agent_stream events as Server-Sent Events."""
+    try:
+        async for event in run_agent_stream(question):
+            yield b"data: " + orjson.dumps(event) + b"\n\n"
+    except Exception as e:
+        logger.error("Error during /ask/stream: %s", e, exc_info=True)
+        yield b"data: " + orjson.dumps({"type": "error", "message": str(e)}) + b"\n\n"
+
+
+@app.post("/ask/stream", tags=["Agent"])
+async def ask_agent_stream(request: QueryRequest):
+    """
+    Streaming variant of /ask, as Server-Sent Events.
+    
+    Emits {"type": "token", "delta": ...} events while the answer is
+    generated, then one {"type": "final", "response": {...}} event with
+    the same payload /ask returns.
+    """
+    logger.debug("Received streaming query: %s", request.question)
+    return StreamingResponse(
+        _sse_events(request.question),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+# --- 8. STARTUP EVENT ---
 @app.on_event("startup")
 async def startup_event():
-    """Log startup information."""
+    """Size the tool threadpool, open the health-check DB handle and log startup information."""
+    # run_agent offloads SQL/vector work with asyncio.to_thread, which uses
+    # the loop's default executor; size it explicitly so bursts queue
+    # predictably instead of depending on the CPU-count default.
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=AGENT_THREADPOOL_SIZE, thread_name_prefix="agent-tools")
+    )
+
+    # One read-only DuckDB connection for the process; /health takes cursors
+    # from it instead of reopening the file on every probe. The tools module
+    # already holds one (and closes it at exit), so share that.
+    app.state.duck = tools.DB
+    app.state.message_count = None
+    app.state.message_count_at = 0.0
+    try:
+        _message_count()
+    except Exception as e:
+        logger.warning(f"Startup: database not available yet - {e}")
+
     logger.info("=" * 50)
     logger.info("Proactive Q&A Agent API Starting")
     logger.info(f"Version: 1.0.0")
@@ -166,7 +258,15 @@ async def startup_event():
     logger.info("=" * 50)
 
 
-# --- 8. MAKE IT RUNNABLE ---
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close the health-check DB handle if /health had to open its own."""
+    duck = getattr(app.state, "duck", None)
+    if duck is not None and duck is not tools.DB:
+        duck.close()
+
+
+# --- 9. MAKE IT RUNNABLE ---
 if __name__ == "__main__":
     logger.info("Starting FastAPI server...")
     port = int(os.environ.get("PORT", 10000))
@@ -174,5 +274,11 @@ if __name__ == "__main__":
         "main:app",
         host="0.0.0.0",
         port=port,
-        reload=False
+        reload=False,
+        # One worker by default. Each extra worker gets its own Gemini RPM
+        # bucket and concurrency cap, encoder, FAISS index and message
+        # columns, and torch thread pool, so opt in via WEB_CONCURRENCY
+        # only after scaling GEMINI_RPM / GEMINI_MAX_CONCURRENCY /
+        # TORCH_NUM_THREADS down to per-worker budgets.
+        workers=int(os.environ.get("WEB_CONCURRENCY", "1"))
     )
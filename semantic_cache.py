@@ -0,0 +1,200 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import google.generativeai as genai
+import numpy as np
+
+# --- 1. LOGGING ---
+
+logger = logging.getLogger(__name__)
+
+# --- 2. CONFIGURATION ---
+
+# One JSON file per entry (answer, digest, timestamp, vector). Entries are
+# only ever created or deleted, never rewritten, so concurrent workers
+# can't clobber each other and an add costs O(1) I/O.
+CACHE_DIR = os.getenv("SEMANTIC_CACHE_DIR", os.path.join("data", "semantic_cache"))
+EMBEDDING_MODEL_NAME = "models/text-embedding-004"
+SIMILARITY_THRESHOLD = 0.92
+TTL_SECONDS = int(os.getenv("SEMANTIC_CACHE_TTL", str(7 * 24 * 3600)))
+# Oldest entries are evicted beyond this many.
+MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "10000"))
+
+# In-memory mirror of the on-disk cache, loaded on first use. Rows live in
+# a buffer that grows by doubling, so adding one is amortized O(1).
+_BUFFER: Optional[np.ndarray] = None   # (capacity, D) float32, L2-normalized rows
+_ENTRIES: List[Dict[str, Any]] = []    # answer, context_digest, created, file
+_LOCK = threading.Lock()
+
+
+# --- 3. HELPERS ---
+
+def context_digest(context: List[Dict[str, Any]]) -> str:
+    """
+    Stable SHA-256 over the evidence. Answers are only reused for the
+    exact same context, so a paraphrase can never borrow an answer that
+    was grounded in different messages.
+    """
+    payload = json.dumps(context, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def embed(question: str) -> Optional[np.ndarray]:
+    """Returns the L2-normalized question embedding, or None on failure."""
+    try:
+        result = await genai.embed_content_async(
+            model=EMBEDDING_MODEL_NAME, content=question
+        )
+        vector = np.asarray(result["embedding"], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+    except Exception as e:
+        logger.warning(f"[Semantic_Cache] Embedding failed: {e}")
+        return None
+
+
+def _vectors() -> np.ndarray:
+    """The filled rows of the buffer (a view, no copy)."""
+    return _BUFFER[:len(_ENTRIES)]
+
+
+def _append_row(vector: np.ndarray) -> None:
+    global _BUFFER
+    n = len(_ENTRIES)
+    if _BUFFER is None or _BUFFER.shape[1] != vector.shape[0]:
+        # First entry, or the embedding model changed: start a new buffer.
+        _BUFFER = np.empty((64, vector.shape[0]), dtype=np.float32)
+    elif n == len(_BUFFER):
+        grown = np.empty((max(64, 2 * len(_BUFFER)), _BUFFER.shape[1]), dtype=np.float32)
+        grown[:n] = _BUFFER
+        _BUFFER = grown
+    _BUFFER[n] = vector
+
+
+def _load() -> None:
+    """Loads every entry file once, deleting expired ones."""
+    global _BUFFER, _ENTRIES
+    if _BUFFER is not None:
+        return
+
+    _BUFFER, _ENTRIES = np.empty((0, 0), dtype=np.float32), []
+    if not os.path.isdir(CACHE_DIR):
+        return
+
+    loaded = []
+    for name in os.listdir(CACHE_DIR):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                record = json.load(f)
+            if isinstance(record, dict) and {"vector", "created"} <= record.keys():
+                loaded.append((record, path))
+        except Exception as e:
+            logger.warning(f"[Semantic_Cache] Skipping unreadable {name}: {e}")
+
+    # Oldest first, so eviction can always drop from the front.
+    loaded.sort(key=lambda item: item[0]["created"])
+    for record, path in loaded:
+        vector = np.asarray(record.pop("vector"), dtype=np.float32)
+        if _ENTRIES and _BUFFER.shape[1] != vector.shape[0]:
+            continue
+        _append_row(vector)
+        _ENTRIES.append({**record, "file": path})
+    _evict()
+
+
+def _evict() -> None:
+    """Drops entries older than TTL_SECONDS, then the oldest beyond MAX_ENTRIES."""
+    global _BUFFER, _ENTRIES
+    cutoff = time.time() - TTL_SECONDS
+    keep_from = 0
+    while keep_from < len(_ENTRIES) and _ENTRIES[keep_from]["created"] < cutoff:
+        keep_from += 1
+    keep_from = max(keep_from, len(_ENTRIES) - MAX_ENTRIES)
+    if keep_from <= 0:
+        return
+
+    for entry in _ENTRIES[:keep_from]:
+        try:
+            os.remove(entry["file"])
+        except OSError:
+            pass  # Already evicted by another worker.
+    _BUFFER = _vectors()[keep_from:].copy()
+    _ENTRIES = _ENTRIES[keep_from:]
+
+
+def _write_entry(record: Dict[str, Any]) -> str:
+    """Writes one entry to a uniquely named file via tmp file + os.replace."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, f"{uuid.uuid4().hex}.json")
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(record, f)
+        # Atomic rename so a crash never leaves a partial entry behind.
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return path
+
+
+# --- 4. PUBLIC API ---
+# Both functions block (file I/O, an O(N) scan); call them via
+# asyncio.to_thread from async code.
+
+def lookup(vector: np.ndarray, digest: str) -> Optional[str]:
+    """
+    Returns a cached answer whose question embedding has cosine
+    similarity >= SIMILARITY_THRESHOLD and whose context matches.
+    """
+    with _LOCK:
+        _load()
+        _evict()
+        if not _ENTRIES or _BUFFER.shape[1] != vector.shape[0]:
+            return None
+
+        # Rows are normalized, so the dot product is the cosine similarity.
+        scores = np.dot(_vectors(), vector)
+        same_context = np.array([e["context_digest"] == digest for e in _ENTRIES])
+        scores = np.where(same_context, scores, -1.0)
+
+        best = int(np.argmax(scores))
+        if scores[best] < SIMILARITY_THRESHOLD:
+            return None
+
+        logger.debug("[Semantic_Cache] Hit (similarity %.3f).", scores[best])
+        return _ENTRIES[best]["answer"]
+
+
+def add(vector: np.ndarray, digest: str, answer: str) -> None:
+    """Stores an answer under its question embedding and context digest."""
+    global _BUFFER, _ENTRIES
+    record = {"answer": answer, "context_digest": digest, "created": time.time()}
+    row = vector.astype(np.float32, copy=False)
+
+    with _LOCK:
+        _load()
+        if _ENTRIES and _BUFFER.shape[1] != row.shape[0]:
+            # Embedding model changed; start over.
+            _BUFFER, _ENTRIES = np.empty((0, 0), dtype=np.float32), []
+
+        try:
+            path = _write_entry({**record, "vector": row.tolist()})
+        except Exception as e:
+            logger.warning(f"[Semantic_Cache] Could not persist entry: {e}")
+            return
+
+        _append_row(row)
+        _ENTRIES.append({**record, "file": path})
+        _evict()
@@ -165,13 +165,35 @@
 #     run_tests()
 
 
+import atexit
+import functools
 import duckdb
 import faiss
 from sentence_transformers import SentenceTransformer
 import numpy as np
+import torch
+import json
 import logging
 import os
-from typing import Optional, List, Dict, Any
+import queue
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Optional, List, Dict, Any, Tuple
+
+# Optional user-name matchers, fastest first: hyperscan (SIMD multi-literal
+# DFA), then pyahocorasick (one pass over the question). Without either,
+# names are checked one by one.
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
 
 # --- 1. LOGGING ---
 
@@ -179,13 +201,77 @@ logger = logging.getLogger(__name__)
 
 # --- 2. CONFIGURATION ---
 
-DB_FILE = "data.db"
-INDEX_FILE = "index.faiss"
-MODEL_NAME = "all-MiniLM-L6-v2"
+from config import DB_FILE, INDEX_FILE, INDEX_META_FILE, MODEL_NAME
 
+# Use a GPU for the encoder and the index when one is visible. Either can be
+# turned off with USE_GPU=0 (e.g. to keep a shared GPU free).
+USE_GPU = os.getenv("USE_GPU", "1") != "0"
+EMBEDDING_DEVICE = "cuda" if USE_GPU and torch.cuda.is_available() else "cpu"
+# Half precision on the GPU paths only (CPU fp16 kernels are slower, not faster).
+USE_FP16 = os.getenv("USE_FP16", "1") != "0"
+# Clone IVF indexes to cuVS (CAGRA-era kernels); needs a faiss build with cuVS.
+USE_CUVS = os.getenv("FAISS_USE_CUVS", "0") == "1"
+# Opt-in: EMBEDDING_BACKEND=onnx serves CPU queries from the model's int8
+# ONNX export through ONNX Runtime (pip install "sentence-transformers[onnx]").
+# The corpus in INDEX_FILE is encoded by index.py with the fp32 PyTorch model,
+# so int8 query vectors drift slightly from it; check recall before enabling.
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+
+
+def _default_onnx_file() -> str:
+    """
+    Picks the quantized export that matches this CPU's int8 instructions
+    (the avx512_vnni file runs slowly, or not at all, without VNNI).
+    """
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = set(next((line for line in f if line.startswith(("flags", "Features"))), "").split())
+    except OSError:
+        flags = set()
+    if "avx512_vnni" in flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    if "avx512f" in flags:
+        return "onnx/model_qint8_avx512.onnx"
+    if "avx2" in flags:
+        return "onnx/model_quint8_avx2.onnx"
+    if "asimd" in flags:
+        return "onnx/model_qint8_arm64.onnx"
+    # No known int8 kernels: use the fp32 export.
+    return "onnx/model.onnx"
+
+
+ONNX_MODEL_FILE = os.getenv("ONNX_MODEL_FILE") or _default_onnx_file()
+
+# Intra-op threads for the CPU encoder (PyTorch, or ONNX Runtime). Unset by
+# default: torch already uses the physical cores. With several workers, set
+# it to (CPUs available to the container) / WEB_CONCURRENCY so the workers
+# and FAISS's OpenMP pool don't oversubscribe the CPU quota.
+ENCODER_THREADS = int(os.getenv("TORCH_NUM_THREADS", "0"))
+if ENCODER_THREADS > 0:
+    torch.set_num_threads(ENCODER_THREADS)
+
+# One read-only connection for the process. Each call takes its own
+# cursor from it, which is safe across threads.
+DB: Optional[duckdb.DuckDBPyConnection] = None
 EMBEDDING_MODEL: Optional[SentenceTransformer] = None
 FAISS_INDEX: Optional[faiss.Index] = None
 ALL_USERS: List[str] = []
+USERS_LOWER: List[str] = []  # ALL_USERS lower-cased, same order
+# Per-user message counts and the (user_name, count) leader. The table is
+# read-only for the life of the process, so facts are served from memory.
+USER_COUNTS: Dict[str, int] = {}
+MOST_ACTIVE: Optional[tuple] = None
+USER_MATCHER: Optional[Any] = None  # ahocorasick.Automaton over ALL_USERS
+USER_HS_DB: Optional[Any] = None    # hyperscan.Database over ALL_USERS
+_hs_local = threading.local()       # per-thread hyperscan scratch space
+
+# The messages table as parallel columns, sorted by rowid, so context hits
+# are resolved by array indexing instead of a query per call.
+ROWIDS = np.empty(0, dtype=np.int64)
+USER_IDX = np.empty(0, dtype=np.int32)   # position in ALL_USERS
+USER_NAMES = np.empty(0, dtype=object)   # ALL_USERS as an array, for gathers
+MESSAGES = np.empty(0, dtype=object)
+TIMESTAMPS = np.empty(0, dtype=object)   # stored as VARCHAR by data_loader
 
 
 # --- 3. ROBUST, NON-FATAL PRELOADING ---
@@ -195,18 +281,30 @@ def _load_resources() -> None:
     Best-effort resource loader.
 
     - Logs warnings if DB or index files are missing.
-    - Tries to load embedding model, FAISS index, and ALL_USERS.
+    - Tries to load embedding model, FAISS index, and the user stats.
     - Never exits the process; leaves globals as None/empty on failure.
     """
-    global EMBEDDING_MODEL, FAISS_INDEX, ALL_USERS
+    global DB, EMBEDDING_MODEL, FAISS_INDEX
 
     db_exists = os.path.exists(DB_FILE)
     index_exists = os.path.exists(INDEX_FILE)
 
     if not db_exists:
-        logger.warning(f"Database file not found: {DB_FILE}. Run data_loader.py.")
+        logger.warning("Database file not found: %s. Run data_loader.py.", DB_FILE)
     if not index_exists:
-        logger.warning(f"Index file not found: {INDEX_FILE}. Run index.py.")
+        logger.warning("Index file not found: %s. Run index.py.", INDEX_FILE)
+
+    if db_exists:
+        try:
+            DB = duckdb.connect(DB_FILE, read_only=True)
+            atexit.register(DB.close)
+        except Exception as e:
+            logger.error("Error opening %s: %s", DB_FILE, e)
+            return
+
+        # Facts only need the DB, so they work even without an index.
+        _load_user_stats()
+        _load_context_columns()
 
     if not (db_exists and index_exists):
         # Degraded mode; /health and tools will reflect this.
@@ -214,25 +312,264 @@ def _load_resources() -> None:
 
     try:
         logger.info("Pre-loading embedding model...")
-        EMBEDDING_MODEL = SentenceTransformer(MODEL_NAME)
+        EMBEDDING_MODEL = _load_encoder()
 
         logger.info("Pre-loading FAISS index...")
-        FAISS_INDEX = faiss.read_index(INDEX_FILE)
+        meta = _load_index_meta()
+        FAISS_INDEX = _read_index(meta)
+        _apply_search_params(FAISS_INDEX, meta)
+        FAISS_INDEX = _to_gpu(FAISS_INDEX)
 
-        with duckdb.connect(DB_FILE, read_only=True) as con:
-            rows = con.execute(
-                "SELECT DISTINCT user_name FROM messages"
-            ).fetchall()
-            ALL_USERS = [row[0] for row in rows]
-
-        logger.info(f"Models loaded. Found {len(ALL_USERS)} unique users.")
+        logger.info("Models loaded. Found %d unique users.", len(ALL_USERS))
 
     except Exception as e:
         # Do not crash; log and stay degraded.
-        logger.error(f"Error loading models or index: {e}")
+        logger.error("Error loading models or index: %s", e)
         EMBEDDING_MODEL = None
         FAISS_INDEX = None
-        ALL_USERS = []
+
+
+def _load_encoder() -> SentenceTransformer:
+    """
+    Loads the query encoder: PyTorch (in fp16 on CUDA), or int8 ONNX on CPU
+    when EMBEDDING_BACKEND=onnx.
+    """
+    if EMBEDDING_BACKEND == "onnx" and EMBEDDING_DEVICE == "cpu":
+        try:
+            model_kwargs: Dict[str, Any] = {"file_name": ONNX_MODEL_FILE}
+            if ENCODER_THREADS > 0:
+                import onnxruntime
+                session_options = onnxruntime.SessionOptions()
+                session_options.intra_op_num_threads = ENCODER_THREADS
+                model_kwargs["session_options"] = session_options
+            model = SentenceTransformer(
+                MODEL_NAME,
+                device="cpu",
+                backend="onnx",
+                model_kwargs=model_kwargs
+            )
+            logger.info("Embedding model running on ONNX Runtime (%s).", ONNX_MODEL_FILE)
+            return model
+        except Exception as e:
+            logger.warning("ONNX encoder unavailable (%s); using PyTorch.", e)
+
+    model = SentenceTransformer(MODEL_NAME, device=EMBEDDING_DEVICE)
+    if USE_FP16 and EMBEDDING_DEVICE == "cuda":
+        model.half()
+    # Inference only: no dropout, and (see seek_context_batch) no autograd.
+    model.eval()
+    return model
+
+
+def _load_user_stats() -> None:
+    """
+    Runs the one GROUP BY that seek_facts needs and keeps the result:
+    ALL_USERS, USER_COUNTS, MOST_ACTIVE and the USER_MATCHER over them.
+    """
+    global ALL_USERS, USERS_LOWER, USER_COUNTS, MOST_ACTIVE, USER_MATCHER, USER_HS_DB
+
+    try:
+        rows = DB.cursor().execute(
+            "SELECT user_name, COUNT(*) FROM messages GROUP BY user_name"
+        ).fetchall()
+    except Exception as e:
+        logger.error("Error loading user stats: %s", e)
+        return
+
+    USER_COUNTS = dict(rows)
+    ALL_USERS = list(USER_COUNTS)
+    USERS_LOWER = [(user_name or "").lower() for user_name in ALL_USERS]
+    MOST_ACTIVE = max(rows, key=lambda row: row[1]) if rows else None
+    USER_HS_DB = _build_user_hs_db(ALL_USERS)
+    USER_MATCHER = None if USER_HS_DB is not None else _build_user_matcher(ALL_USERS)
+
+
+def _load_context_columns() -> None:
+    """
+    Loads rowid, user, message and timestamp into the column arrays used by
+    seek_context_batch. User names are stored as ids into ALL_USERS.
+    """
+    global ROWIDS, USER_IDX, USER_NAMES, MESSAGES, TIMESTAMPS
+
+    if not USER_COUNTS:
+        return
+
+    try:
+        tbl = DB.cursor().execute(
+            "SELECT rowid, user_name, message, timestamp FROM messages ORDER BY rowid"
+        ).fetch_arrow_table()
+    except Exception as e:
+        logger.error("Error loading message columns: %s", e)
+        return
+
+    user_ids = {user_name: i for i, user_name in enumerate(ALL_USERS)}
+    ROWIDS = tbl["rowid"].to_numpy()
+    USER_NAMES = np.array(ALL_USERS, dtype=object)
+    USER_IDX = np.fromiter(
+        (user_ids[u] for u in tbl["user_name"].to_pylist()),
+        dtype=np.int32, count=tbl.num_rows
+    )
+    MESSAGES = np.array(tbl["message"].to_pylist(), dtype=object)
+    TIMESTAMPS = np.array([str(ts) for ts in tbl["timestamp"].to_pylist()], dtype=object)
+
+
+def _load_index_meta() -> Dict[str, Any]:
+    """
+    Reads the index metadata written by index.py.
+    Returns an empty dict if it is missing or unreadable.
+    """
+    if not os.path.exists(INDEX_META_FILE):
+        return {}
+
+    try:
+        with open(INDEX_META_FILE, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning("Could not read %s: %s", INDEX_META_FILE, e)
+        return {}
+
+
+def _read_index(meta: Dict[str, Any]) -> faiss.Index:
+    """
+    Memory-maps the index read-only instead of copying it onto each
+    worker's heap, so every uvicorn worker shares one page-cache copy:
+    - sq8 / flat / HNSW: IO_FLAG_MMAP_IFC maps the flat code array
+      (for HNSW, its storage); the HNSW graph links are still read in.
+    - ivfpq: IO_FLAG_MMAP maps the inverted lists, which may stay on disk.
+    Falls back to a regular read for index types that can't be mapped.
+    """
+    if meta.get("type") == "ivfpq":
+        flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_ONDISK_SAME_DIR
+    else:
+        flags = faiss.IO_FLAG_MMAP_IFC
+    flags |= faiss.IO_FLAG_READ_ONLY
+
+    try:
+        return faiss.read_index(INDEX_FILE, flags)
+    except Exception as e:
+        logger.warning("Could not memory-map FAISS index (%s); reading it into memory.", e)
+        return faiss.read_index(INDEX_FILE)
+
+
+def _num_gpus() -> int:
+    """GPUs usable by FAISS; 0 for CPU-only builds (no get_num_gpus)."""
+    if not USE_GPU or not hasattr(faiss, "get_num_gpus"):
+        return 0
+    return faiss.get_num_gpus()
+
+
+def _to_gpu(index: faiss.Index) -> faiss.Index:
+    """
+    Clones the index onto the GPU(s) when faiss-gpu sees any; the GPU index
+    has the same search API. Sharded across devices when there are several.
+    Index types without a GPU implementation stay on the CPU.
+    """
+    ngpu = _num_gpus()
+    if ngpu == 0:
+        return index
+
+    try:
+        co = faiss.GpuMultipleClonerOptions() if ngpu > 1 else faiss.GpuClonerOptions()
+        # Store vectors and the coarse quantizer as fp16: half the memory
+        # traffic and Tensor Core (Hgemm) distance kernels.
+        co.useFloat16 = USE_FP16
+        co.useFloat16CoarseQuantizer = USE_FP16
+        if USE_CUVS:
+            co.use_cuvs = True
+        if ngpu > 1:
+            co.shard = True
+            gpu_index = faiss.index_cpu_to_all_gpus(index, co=co)
+        else:
+            gpu_index = faiss.index_cpu_to_gpu(faiss.StandardGpuResources(), 0, index, co)
+        logger.info("FAISS index moved to %d GPU(s).", ngpu)
+        return gpu_index
+    except Exception as e:
+        logger.warning("Could not move FAISS index to GPU (%s); searching on CPU.", e)
+        return index
+
+
+def _apply_search_params(index: faiss.Index, meta: Dict[str, Any]) -> None:
+    """
+    Applies the search-time knobs recorded by index.py for the index type
+    it chose. Flat indexes (and a missing meta file) need nothing.
+    FAISS_NPROBE / FAISS_EF_SEARCH override the recorded values, to trade
+    recall for latency without rebuilding.
+    """
+    try:
+        if meta.get("type") == "hnsw":
+            # index.py wraps the graph in an IndexIDMap2 keyed by rowid
+            base = faiss.downcast_index(index.index) if hasattr(index, "id_map") else index
+            base.hnsw.efSearch = int(os.getenv("FAISS_EF_SEARCH", meta["ef_search"]))
+        elif meta.get("type") == "ivfpq":
+            faiss.extract_index_ivf(index).nprobe = int(os.getenv("FAISS_NPROBE", meta["nprobe"]))
+
+        logger.info("FAISS index type: %s.", meta.get("type", "unknown"))
+    except Exception as e:
+        logger.warning("Could not apply index search params: %s", e)
+
+
+def _build_user_matcher(users: List[str]) -> Optional[Any]:
+    """Compiles the user names into an Aho-Corasick automaton, if available."""
+    if ahocorasick is None or not users:
+        return None
+
+    automaton = ahocorasick.Automaton()
+    for user_name in users:
+        if user_name:
+            automaton.add_word(user_name.lower(), user_name)
+    automaton.make_automaton()
+    return automaton
+
+
+def _build_user_hs_db(users: List[str]) -> Optional[Any]:
+    """Compiles the user names into one hyperscan database, if available."""
+    if hyperscan is None or not users:
+        return None
+
+    try:
+        ids = [i for i, user_name in enumerate(users) if user_name]
+        db = hyperscan.Database(mode=hyperscan.HS_MODE_BLOCK)
+        db.compile(
+            expressions=[re.escape(users[i].lower()).encode() for i in ids],
+            ids=ids,
+            flags=[hyperscan.HS_FLAG_CASELESS | hyperscan.HS_FLAG_SINGLEMATCH] * len(ids)
+        )
+        return db
+    except Exception as e:
+        logger.warning("Could not compile hyperscan user matcher (%s).", e)
+        return None
+
+
+def _hs_scratch() -> Any:
+    """Hyperscan scratch space is not thread-safe; keep one per thread."""
+    scratch = getattr(_hs_local, "scratch", None)
+    if scratch is None or _hs_local.db is not USER_HS_DB:
+        scratch = _hs_local.scratch = hyperscan.Scratch(USER_HS_DB)
+        _hs_local.db = USER_HS_DB
+    return scratch
+
+
+def _find_user(q_lower: str) -> Optional[str]:
+    """
+    Returns the user named in the (lower-cased) question, or None.
+    With several matches the longest name wins ("Lily O'Sullivan" over "Lily").
+    """
+    if USER_HS_DB is not None:
+        matches: List[str] = []
+
+        def on_match(user_id, start, end, flags, context):
+            matches.append(ALL_USERS[user_id])
+
+        USER_HS_DB.scan(q_lower.encode(), match_event_handler=on_match, scratch=_hs_scratch())
+        return max(matches, key=len) if matches else None
+
+    if USER_MATCHER is not None:
+        matches = [user_name for _, user_name in USER_MATCHER.iter(q_lower)]
+        return max(matches, key=len) if matches else None
+
+    matches = [user_name for user_name, user_lower in zip(ALL_USERS, USERS_LOWER)
+               if user_lower and user_lower in q_lower]
+    return max(matches, key=len) if matches else None
 
 
 # Run once at import time.
@@ -241,175 +578,349 @@ _load_resources()
 
 # --- 4. TOOL 1: FACT SEEKER ---
 
+# Results are memoized per normalized question; see _cache_key.
+TOOL_CACHE_SIZE = int(os.getenv("TOOL_CACHE_SIZE", "4096"))
+
+
+def _cache_key(question: str) -> str:
+    """
+    Lower-cased, whitespace-collapsed question. Both tools match on the
+    lower-cased text, and MiniLM's tokenizer is uncased, so questions
+    that differ only in case or spacing share a cache entry.
+    """
+    return " ".join(question.lower().split())
+
+
+def tool_cache_info() -> Dict[str, Dict[str, int]]:
+    """Hit/miss counters of the tool result caches."""
+    return {
+        "facts": _cached_facts.cache_info()._asdict(),
+        "context": _cached_context.cache_info()._asdict(),
+    }
+
+
 def seek_facts(question: str) -> Optional[Dict[str, Any]]:
     """
-    Uses SQL to find specific, factual answers from the database.
+    Answers specific, factual questions from the per-user message counts
+    aggregated at load time (no database round-trip per call).
     Returns a structured dict or None if no fact is found or DB unavailable.
     """
-    logger.info(f"[Tool 1: Fact_Seeker] Received query: '{question}'")
+    logger.debug("[Tool 1: Fact_Seeker] Received query: '%s'", question)
 
-    if not os.path.exists(DB_FILE):
+    if not USER_COUNTS:
         logger.warning("[Fact_Seeker] DB not available; returning None.")
         return None
 
-    try:
-        with duckdb.connect(DB_FILE, read_only=True) as con:
-            q_lower = question.lower()
+    fact = _cached_facts(_cache_key(question))
+    if fact is None:
+        logger.debug("[Tool 1: Fact_Seeker] No specific fact found.")
+        return None
+    # Callers get their own copy; the cached dict must stay untouched.
+    return dict(fact)
+
+
+@functools.lru_cache(maxsize=TOOL_CACHE_SIZE)
+def _cached_facts(q_lower: str) -> Optional[Dict[str, Any]]:
+    """seek_facts for a normalized question. Facts are fixed per process."""
+    # Skill 1: Most active user
+    if "most active" in q_lower and MOST_ACTIVE:
+        user_name, count = MOST_ACTIVE
+        return {
+            "fact": "most_active_user",
+            "answer": user_name,
+            "context": (
+                f"{user_name} is the most active user "
+                f"with {count} messages."
+            ),
+        }
 
-            # Skill 1: Most active user
-            if "most active" in q_lower:
-                try:
-                    result = con.execute(
-                        """
-                        SELECT user_name, COUNT(*) as msg_count
-                        FROM messages
-                        GROUP BY user_name
-                        ORDER BY msg_count DESC
-                        LIMIT 1
-                        """
-                    ).fetchone()
-
-                    if result:
-                        user_name, count = result
-                        return {
-                            "fact": "most_active_user",
-                            "answer": user_name,
-                            "context": (
-                                f"{user_name} is the most active user "
-                                f"with {count} messages."
-                            ),
-                        }
-                except Exception as e:
-                    logger.error(f"[Fact_Seeker] Error finding active user: {e}")
-
-            # Skill 2: Message count for a user
-            if "how many messages" in q_lower and ALL_USERS:
-                try:
-                    found_user = None
-                    for user_name in ALL_USERS:
-                        if user_name.lower() in q_lower:
-                            found_user = user_name
-                            break
-
-                    if found_user:
-                        count = con.execute(
-                            "SELECT COUNT(*) FROM messages WHERE user_name = ?",
-                            [found_user],
-                        ).fetchone()[0]
-
-                        return {
-                            "fact": "user_message_count",
-                            "answer": str(count),
-                            "context": (
-                                f"{found_user} has sent {count} messages."
-                            ),
-                        }
-                except Exception as e:
-                    logger.error(
-                        f"[Fact_Seeker] Error finding message count: {e}"
-                    )
+    # Skill 2: Message count for a user
+    if "how many messages" in q_lower:
+        found_user = _find_user(q_lower)
 
-    except Exception as e:
-        logger.error(f"[Fact_Seeker] DB error: {e}")
-        return None
+        if found_user:
+            count = USER_COUNTS[found_user]
+            return {
+                "fact": "user_message_count",
+                "answer": str(count),
+                "context": (
+                    f"{found_user} has sent {count} messages."
+                ),
+            }
 
-    logger.info("[Tool 1: Fact_Seeker] No specific fact found.")
     return None
 
 
 # --- 5. TOOL 2: CONTEXT SEEKER (WITH TIMESTAMPS) ---
 
+# Questions per encoder forward pass in seek_context_batch
+QUERY_BATCH_SIZE = 32
+
+
+
 def seek_context(question: str, top_k: int = 3) -> Optional[List[Dict[str, Any]]]:
     """
     Uses FAISS vector search to find the most relevant messages.
     Returns a list of dicts with user_name, message, timestamp, rowid.
+    Concurrent callers are coalesced into one batched search.
     """
-    logger.info(f"[Tool 2: Context_Seeker] Received query: '{question}'")
+    logger.debug("[Tool 2: Context_Seeker] Received query: '%s'", question)
+    try:
+        contexts = _cached_context(_cache_key(question), top_k)
+    except _NoContext:
+        return None
+    # Fresh dicts per caller, so no one can mutate the cached entry.
+    return [dict(context) for context in contexts]
+
+
+class _NoContext(Exception):
+    """Raised instead of returning None, so lru_cache doesn't keep misses."""
+
+
+@functools.lru_cache(maxsize=TOOL_CACHE_SIZE)
+def _cached_context(question_key: str, top_k: int) -> Tuple[Dict[str, Any], ...]:
+    """
+    seek_context for a normalized question. Misses (including transient
+    errors, which also yield None) are re-tried on the next call.
+    """
+    contexts = CONTEXT_BATCHER.submit(question_key, top_k)
+    if contexts is None:
+        raise _NoContext()
+    return tuple(contexts)
+
+
+def seek_context_batch(
+    questions: List[str], top_k: int = 3
+) -> List[Optional[List[Dict[str, Any]]]]:
+    """
+    Batched seek_context: one encoder call, one FAISS search over a
+    (B, d) query matrix, then hits are read from the in-memory columns.
+    Returns one result per question, in order (None where nothing found).
+    """
+    if not questions:
+        return []
+    no_results: List[Optional[List[Dict[str, Any]]]] = [None] * len(questions)
 
     if EMBEDDING_MODEL is None or FAISS_INDEX is None:
         logger.warning(
             "[Context_Seeker] Embedding model or FAISS index not loaded; "
             "returning None."
         )
-        return None
+        return no_results
 
-    if not os.path.exists(DB_FILE):
+    if ROWIDS.size == 0:
         logger.warning("[Context_Seeker] DB not available; returning None.")
-        return None
+        return no_results
 
     try:
-        # Compute embedding
-        question_embedding = EMBEDDING_MODEL.encode(
-            [question], convert_to_numpy=True
-        ).astype("float32")
-
-        # FAISS search
-        D, I = FAISS_INDEX.search(question_embedding, top_k)
-        message_indices = [int(i) for i in I[0] if i >= 0]
-
-        if not message_indices:
-            logger.info("[Context_Seeker] No indices returned by FAISS.")
-            return None
-
-        with duckdb.connect(DB_FILE, read_only=True) as con:
-            indices_str = ", ".join(map(str, message_indices))
-            results = con.execute(
-                f"""
-                SELECT rowid, user_name, message, timestamp
-                FROM messages
-                WHERE rowid IN ({indices_str})
-                """
-            ).fetchall()
-
-        # Reorder according to FAISS relevance
-        results_map = {
-            rowid: (user, msg, ts)
-            for rowid, user, msg, ts in results
+        # Identical questions (common under micro-batching) share one encoder
+        # row and one search row. encode() already sorts by length, so each
+        # padded sub-batch holds similar-length questions.
+        unique_questions = list(dict.fromkeys(questions))
+
+        # Compute embeddings (FAISS takes float32 input even for fp16 indexes)
+        # inference_mode is thread-local, so it's set per call (tools run on
+        # asyncio.to_thread workers) rather than once at import.
+        with torch.inference_mode():
+            question_embeddings = EMBEDDING_MODEL.encode(
+                unique_questions,
+                batch_size=QUERY_BATCH_SIZE,
+                convert_to_numpy=True,
+                # Unit-length, like the indexed vectors: inner product == cosine
+                normalize_embeddings=True
+            ).astype("float32", copy=False)  # no-op unless the encoder ran in fp16
+
+        # FAISS search (batched queries are spread over OpenMP threads)
+        D, I = FAISS_INDEX.search(question_embeddings, top_k)
+
+        # FAISS ids are rowids; find their positions in the column arrays.
+        # Misses (-1 padding, or ids not in the table) are dropped.
+        pos = np.searchsorted(ROWIDS, I)
+        found = (I >= 0) & (pos < ROWIDS.size)
+        found[found] = ROWIDS[pos[found]] == I[found]
+
+        if not found.any():
+            logger.debug("[Context_Seeker] No indices returned by FAISS.")
+            return no_results
+
+        # Rows of I are already in FAISS relevance order; gather each row's
+        # hits with one fancy-index per column.
+        unique_results: List[Optional[List[Dict[str, Any]]]] = []
+        for row_ids, row_pos, row_found in zip(I, pos, found):
+            hits = row_pos[row_found]
+            ordered_results: List[Dict[str, Any]] = [
+                {
+                    "user_name": user,
+                    "message": msg,
+                    "timestamp": ts,
+                    "rowid": rowid,
+                }
+                for user, msg, ts, rowid in zip(
+                    USER_NAMES[USER_IDX[hits]].tolist(),
+                    MESSAGES[hits].tolist(),
+                    TIMESTAMPS[hits].tolist(),
+                    row_ids[row_found].tolist(),
+                )
+            ]
+            unique_results.append(ordered_results or None)
+
+        # Fan back out to the caller's order; repeats get their own dicts.
+        row_of = {question: i for i, question in enumerate(unique_questions)}
+        batch_results: List[Optional[List[Dict[str, Any]]]] = []
+        seen = set()
+        for question in questions:
+            result = unique_results[row_of[question]]
+            if question in seen and result:
+                result = [dict(context) for context in result]
+            seen.add(question)
+            batch_results.append(result)
+
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "[Context_Seeker] Found %d relevant contexts for %d queries.",
+                sum(len(r) for r in batch_results if r), len(questions)
+            )
+        return batch_results
+
+    except Exception as e:
+        logger.error("[Context_Seeker] Error searching index: %s", e)
+        return no_results
+
+
+# --- 6. MICRO-BATCHING FOR CONCURRENT CALLERS ---
+
+CONTEXT_MAX_BATCH = int(os.getenv("CONTEXT_MAX_BATCH", "32"))
+# How long the first request in a batch waits for company; 0 disables.
+CONTEXT_MAX_WAIT_MS = float(os.getenv("CONTEXT_MAX_WAIT_MS", "5"))
+# Seconds a caller waits on the batcher before searching on its own thread.
+CONTEXT_BATCH_TIMEOUT = float(os.getenv("CONTEXT_BATCH_TIMEOUT", "10"))
+
+
+class _ContextBatcher:
+    """
+    Coalesces seek_context calls from concurrent threads. A background
+    worker takes the first queued request, collects more for up to
+    max_wait_ms (or until max_batch), and serves them with one
+    seek_context_batch call per distinct top_k. Each caller blocks on its
+    own Future, for at most `timeout` seconds; past that (a wedged or dead
+    worker) it falls back to a direct seek_context_batch call.
+    """
+
+    def __init__(self, max_batch: int, max_wait_ms: float, timeout: float):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait_ms / 1000
+        self.timeout = timeout
+        self._queue: "queue.Queue[Tuple[str, int, Future, float]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._started_at = time.monotonic()
+        self._requests = 0
+        self._batches = 0
+        self._latencies: deque = deque(maxlen=1000)  # seconds, most recent
+
+    def submit(self, question: str, top_k: int) -> Optional[List[Dict[str, Any]]]:
+        self._ensure_worker()
+        future: Future = Future()
+        self._queue.put((question, top_k, future, time.perf_counter()))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Cancel so the worker skips it if it ever gets there.
+            future.cancel()
+            logger.warning("[Context_Seeker] Batcher timed out after %.1fs; searching directly.", self.timeout)
+            return seek_context_batch([question], top_k)[0]
+
+    def metrics(self) -> Dict[str, Any]:
+        """Throughput, mean batch size and p99 latency since startup."""
+        latencies = sorted(self._latencies)
+        p99 = latencies[int(0.99 * (len(latencies) - 1))] if latencies else 0.0
+        uptime = time.monotonic() - self._started_at
+        return {
+            "requests": self._requests,
+            "batches": self._batches,
+            "qps": round(self._requests / uptime, 3) if uptime > 0 else 0.0,
+            "avg_batch_size": round(self._requests / self._batches, 2) if self._batches else 0.0,
+            "p99_latency_ms": round(p99 * 1000, 2),
         }
 
-        ordered_results: List[Dict[str, Any]] = []
-        for rowid in message_indices:
-            if rowid in results_map:
-                user, msg, ts = results_map[rowid]
-                ordered_results.append(
-                    {
-                        "user_name": user,
-                        "message": msg,
-                        "timestamp": str(ts),
-                        "rowid": rowid,
-                    }
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                if self._worker is not None:
+                    logger.error("[Context_Seeker] Batcher worker died; restarting it.")
+                self._worker = threading.Thread(
+                    target=self._run, name="context-batcher", daemon=True
                 )
+                self._worker.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(
+                        self._queue.get(timeout=remaining) if remaining > 0
+                        else self._queue.get_nowait()
+                    )
+                except queue.Empty:
+                    break
+            try:
+                self._serve(batch)
+            except Exception:
+                # Keep the worker alive; the callers fall back on timeout.
+                logger.exception("[Context_Seeker] Batcher failed to serve a batch.")
 
-        logger.info(
-            f"[Context_Seeker] Found {len(ordered_results)} "
-            "relevant contexts."
-        )
-        return ordered_results or None
+    def _serve(self, batch: List[Tuple[str, int, Future, float]]) -> None:
+        by_top_k: Dict[int, List[Tuple[str, int, Future, float]]] = {}
+        for item in batch:
+            # False if the caller already timed out and cancelled it.
+            if item[2].set_running_or_notify_cancel():
+                by_top_k.setdefault(item[1], []).append(item)
 
-    except Exception as e:
-        logger.error(f"[Context_Seeker] Error searching index: {e}")
-        return None
+        for top_k, items in by_top_k.items():
+            try:
+                results = seek_context_batch([question for question, _, _, _ in items], top_k)
+            except Exception as e:
+                for _, _, future, _ in items:
+                    future.set_exception(e)
+                continue
+
+            done = time.perf_counter()
+            for (_, _, future, submitted), result in zip(items, results):
+                self._latencies.append(done - submitted)
+                future.set_result(result)
 
+        self._requests += len(batch)
+        self._batches += 1
+        logger.debug("[Context_Seeker] Served batch of %d.", len(batch))
 
-# --- 6. SIMPLE LOCAL TEST ENTRYPOINT ---
+
+CONTEXT_BATCHER = _ContextBatcher(CONTEXT_MAX_BATCH, CONTEXT_MAX_WAIT_MS, CONTEXT_BATCH_TIMEOUT)
+
+
+# --- 7. SIMPLE LOCAL TEST ENTRYPOINT ---
 
 def run_tests() -> None:
     """Runs basic tests on tools for local debugging."""
     logger.info("--- (Test) Tool 1: Fact_Seeker ---")
     q1 = "Who is the most active user?"
     a1 = seek_facts(q1)
-    logger.info(f"Q: {q1}\nA: {a1}")
+    logger.info("Q: %s\nA: %s", q1, a1)
 
     q2 = "How many messages did Thiago Monteiro send?"
     a2 = seek_facts(q2)
-    logger.info(f"Q: {q2}\nA: {a2}")
+    logger.info("Q: %s\nA: %s", q2, a2)
 
     logger.info("\n--- (Test) Tool 2: Context_Seeker ---")
     q3 = "What does Lily O'Sullivan like?"
     a3 = seek_context(q3)
-    import json
-
-    logger.info(f"Q: {q3}\nContext Found:\n{json.dumps(a3, indent=2)}")
+    # Only pretty-print when the record will actually be emitted.
+    if logger.isEnabledFor(logging.INFO):
+        logger.info("Q: %s\nContext Found:\n%s", q3, json.dumps(a3, indent=2))
 
 
 if __name__ == "__main__":